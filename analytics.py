@@ -0,0 +1,167 @@
+from datetime import date, datetime, timedelta
+
+from timestamps import parse_timestamp
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# Filters on the orders' status and gender and the customer's country
+TIMESERIES_FILTERS = ('status', 'gender', 'country')
+
+# Hourly buckets are computed from orders on demand, so their range is capped
+MAX_HOURLY_DAYS = 31
+
+# Longest series one request may produce
+MAX_BUCKETS = 5000
+
+MEASURES = ('orders', 'items', 'shipped', 'delivered', 'returned')
+
+
+class InvalidAnalyticsQuery(ValueError):
+    """Raised when a time-series parameter cannot be used"""
+
+
+def parse_timestamp_arg(args, name):
+    """Validate an ISO date or datetime parameter and return it as UTC text like the stored timestamps"""
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise InvalidAnalyticsQuery(f'{name} must be an ISO date such as 2022-01-31')
+
+
+def parse_timeseries_args(args):
+    """Return granularity, start, end and filters from the query string"""
+    granularity = args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise InvalidAnalyticsQuery(f'granularity must be one of: {", ".join(GRANULARITIES)}')
+    start = parse_timestamp_arg(args, 'start')
+    end = parse_timestamp_arg(args, 'end')
+    if start and end and start >= end:
+        raise InvalidAnalyticsQuery('start must be before end')
+
+    if granularity == 'hour':
+        if not start or not end:
+            raise InvalidAnalyticsQuery('hourly buckets need both start and end')
+        if datetime.fromisoformat(end) - datetime.fromisoformat(start) > timedelta(days=MAX_HOURLY_DAYS):
+            raise InvalidAnalyticsQuery(f'hourly buckets cover at most {MAX_HOURLY_DAYS} days')
+    elif (start and len(start) > 10) or (end and len(end) > 10):
+        raise InvalidAnalyticsQuery(f'{granularity} buckets take dates without a time')
+
+    filters = {name: args[name] for name in TIMESERIES_FILTERS if args.get(name) is not None}
+    return granularity, start, end, filters
+
+
+def rollup_query(start, end, filters):
+    """Per-day sums from the rollup table, in day order straight off its primary key"""
+    clauses, params = [], []
+    if start:
+        clauses.append('day >= ?')
+        params.append(start)
+    if end:
+        clauses.append('day < ?')
+        params.append(end)
+    for name, value in filters.items():
+        clauses.append(f'{name} = ?')
+        params.append(value)
+    sql = '''
+        SELECT day, SUM(orders), SUM(items), SUM(shipped), SUM(delivered), SUM(returned)
+        FROM order_daily_rollup
+    '''
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    return sql + ' GROUP BY day ORDER BY day', params
+
+
+def hourly_query(start, end, filters):
+    """One row per order in the range, labelled with its UTC hour, read in created_at order"""
+    clauses = ['o.created_at >= ?', 'o.created_at < ?']
+    params = [start, end]
+    for name, value in filters.items():
+        # Same '' for unknown values as the rollup uses
+        table = 'u' if name == 'country' else 'o'
+        clauses.append(f"COALESCE({table}.{name}, '') = ?")
+        params.append(value)
+    join = 'LEFT JOIN users u ON u.id = o.user_id' if 'country' in filters else ''
+    sql = f'''
+        SELECT strftime('%Y-%m-%d %H:00', o.created_at), 1, COALESCE(o.num_of_item, 0),
+               o.shipped_at IS NOT NULL, o.delivered_at IS NOT NULL, o.returned_at IS NOT NULL
+        FROM orders o
+        {join}
+        WHERE {' AND '.join(clauses)}
+        ORDER BY o.created_at
+    '''
+    return sql, params
+
+
+def bucket_of(day, granularity):
+    """The bucket a 'YYYY-MM-DD' day falls into: the day, its Monday, or the 1st of its month"""
+    if granularity == 'week':
+        monday = date.fromisoformat(day)
+        return (monday - timedelta(days=monday.weekday())).isoformat()
+    if granularity == 'month':
+        return day[:8] + '01'
+    return day
+
+
+def next_bucket(bucket, granularity):
+    """The bucket following bucket, or None past the last representable date"""
+    try:
+        if granularity == 'hour':
+            return (datetime.fromisoformat(bucket) + timedelta(hours=1)).isoformat(' ', timespec='minutes')
+        current = date.fromisoformat(bucket)
+        if granularity == 'week':
+            return (current + timedelta(days=7)).isoformat()
+        if granularity == 'month':
+            return (current.replace(day=28) + timedelta(days=4)).replace(day=1).isoformat()
+        return (current + timedelta(days=1)).isoformat()
+    except OverflowError:
+        return None
+
+
+def first_bucket(start, granularity):
+    """The bucket containing a start date or datetime"""
+    if granularity == 'hour':
+        # isoformat() keeps four-digit years, which strftime('%Y') drops below 1000
+        return datetime.fromisoformat(start).replace(minute=0, second=0).isoformat(' ', timespec='minutes')
+    return bucket_of(start[:10], granularity)
+
+
+def build_series(rows, granularity, start=None, end=None):
+    """Fold (label, orders, items, shipped, delivered, returned) rows into buckets
+
+    Rows arrive in time order; buckets with no orders between the first
+    and last are filled with zeros so charts get an evenly spaced series.
+    """
+    totals = {}
+    for label, *values in rows:
+        bucket = label if granularity == 'hour' else bucket_of(label, granularity)
+        sums = totals.setdefault(bucket, [0] * len(MEASURES))
+        for i, value in enumerate(values):
+            sums[i] += value or 0
+
+    if start:
+        bucket = first_bucket(start, granularity)
+    elif totals:
+        bucket = min(totals)
+    else:
+        return []
+    last = max(totals) if totals else bucket
+    if end:
+        # end is exclusive: the last bucket is the one holding the moment before it
+        last = first_bucket((datetime.fromisoformat(end) - timedelta(seconds=1)).isoformat(' '), granularity)
+
+    series = []
+    while bucket is not None and bucket <= last:
+        if len(series) == MAX_BUCKETS:
+            raise InvalidAnalyticsQuery(f'at most {MAX_BUCKETS} buckets per request; narrow start/end')
+        point = dict(zip(MEASURES, totals.get(bucket, [0] * len(MEASURES))))
+        orders = point['orders']
+        point['bucket'] = bucket
+        point['avg_items_per_order'] = point['items'] / orders if orders else None
+        for step in ('shipped', 'delivered', 'returned'):
+            point[f'{step}_rate'] = point[step] / orders if orders else None
+        series.append(point)
+        bucket = next_bucket(bucket, granularity)
+    return series
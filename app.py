@@ -1,255 +1,406 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-import sqlite3
-import json
-from datetime import datetime
+import os
+import re
+import db
+import queries
+from db import get_db_connection, discard_db_connection
+from pagination import page_error
+from cache import CountCache, LRUCache, InvalidBatch, check_batch_ids, parse_ids_arg
+from http_cache import cached_endpoint
+from analytics import (InvalidAnalyticsQuery, parse_timeseries_args, rollup_query,
+                       hourly_query, build_series)
+from fulfillment import FulfillmentAnalytics, GROUP_BYS
+from segments import (MAX_TOP, InvalidSegmentQuery, parse_metric, parse_segment_args,
+                      parse_month, top_query, segment_query, segment_count_query, cohort_query)
+from serializers import Rows, RowJSONProvider
+from views import CLIENT_ERRORS, Views, bool_arg
+import compression
+import metrics
+from export import (EXPORT_FORMATS, ORDER_EXPORT_COLUMNS, CUSTOMER_EXPORT_COLUMNS,
+                    InvalidExportFilter, orders_export_query, customers_export_query,
+                    ndjson_chunks, csv_chunks, gzip_chunks)
 
 app = Flask(__name__)
+app.json = RowJSONProvider(app)  # Result rows encode straight to JSON, without a dict per row
 CORS(app)  # Enable CORS for frontend integration
+db.init_app(app)  # Pooled connections, returned to the pool on teardown
 
-def get_db_connection():
-    """Create and return a database connection"""
-    conn = sqlite3.connect('ecommerce.db')
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    return conn
+# Request latency and per-query timings on /metrics; registered first so it also times compression
+metrics.init_app(app)
+
+# gzip/brotli for clients that accept it; bodies with an ETag are compressed only once
+compressor = compression.Compressor(
+    min_size=int(os.environ.get('COMPRESS_MIN_SIZE', compression.MIN_SIZE)),
+    max_bytes=int(os.environ.get('COMPRESS_STORE_BYTES', 64 * 1024 * 1024))
+)
+compression.init_app(app, compressor)
+
+count_cache = CountCache()  # total_count per table, kept until the table changes
+
+# Columnar order timestamps for fulfillment latency, reloaded when the data changes
+fulfillment = FulfillmentAnalytics()
+
+# Single customers/orders, dropped when their rows change (sizes tunable per deployment)
+entity_cache = LRUCache(
+    max_size=int(os.environ.get('ENTITY_CACHE_SIZE', 10000)),
+    ttl=int(os.environ.get('ENTITY_CACHE_TTL', 300))
+)
+
+# The customer, order and statistics endpoints, shared with asgi.py
+views = Views(count_cache, entity_cache)
+
+def internal_error(e):
+    """Log the error, then build the generic 500 response and drop the request's connection"""
+    app.logger.exception('Unhandled error in %s %s', request.method, request.full_path)
+    metrics.registry.count_error(request.endpoint)
+    discard_db_connection()
+    return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+def get_batch_ids():
+    """Read ids from ?ids=1,2,3 or a JSON body {"ids": [1, 2, 3]}, without duplicates"""
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        ids = body.get('ids') if isinstance(body, dict) else None
+        if not isinstance(ids, list) or not all(type(i) is int for i in ids):
+            raise InvalidBatch('Request body must be {"ids": [list of integers]}')
+        return check_batch_ids(ids)
+    return parse_ids_arg(request.args['ids'])
+
+# Most words of a search query that are matched
+SEARCH_MAX_TERMS = 8
+
+def build_search_query(text):
+    """Turn free text into an FTS5 query that prefix-matches every word"""
+    terms = re.findall(r'\w+', text)[:SEARCH_MAX_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def get_bool_arg(name, default):
+    """Read a true/false query parameter such as include_total=false"""
+    return bool_arg(request.args, name, default)
+
+def run_view(view, *ids):
+    """Answer a request with one of the shared views, run on this request's connection"""
+    try:
+        payload, status = view(get_db_connection(), request.args, *ids)
+    except CLIENT_ERRORS as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return internal_error(e)
+    return jsonify(payload), status
+
+def run_batch(view):
+    """Answer a batch lookup for the ids in the query string or JSON body"""
+    try:
+        ids = get_batch_ids()
+        payload, status = view(get_db_connection(), ids)
+    except InvalidBatch as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return internal_error(e)
+    return jsonify(payload), status
 
 @app.route('/api/customers', methods=['GET'])
+@cached_endpoint(tables=lambda: ('users', 'orders') if 'ids' in request.args else ('users',))
 def get_customers():
-    """List all customers with pagination"""
+    """List all customers with page or cursor pagination, filtered and sorted, or look up ?ids=1,2,3"""
+    return run_view(views.list_customers)
+
+@app.route('/api/customers/batch', methods=['POST'])
+def get_customers_batch():
+    """Get details and order counts for many customers in one request"""
+    return run_batch(views.customers_batch)
+
+@app.route('/api/customers/search', methods=['GET'])
+@cached_endpoint(tables=('users',))
+def search_customers():
+    """Search customers by name, email, city or state, best matches first"""
     try:
-        # Get pagination parameters
+        # Get search and pagination parameters
+        query = request.args.get('q', '')
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
         # Validate parameters
-        if page < 1:
-            return jsonify({'error': 'Page number must be greater than 0'}), 400
-        if per_page < 1 or per_page > 100:
-            return jsonify({'error': 'Per page must be between 1 and 100'}), 400
+        match = build_search_query(query)
+        if not match:
+            return jsonify({'error': 'Search query must contain letters or numbers'}), 400
+        error = page_error(page, per_page)
+        if error:
+            return jsonify({'error': error}), 400
         
         offset = (page - 1) * per_page
-        
         conn = get_db_connection()
         
-        # Get total count for pagination info
-        total_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-        
-        # Get customers with pagination
-        customers = conn.execute('''
-            SELECT id, first_name, last_name, email, age, gender, 
-                   state, city, country, created_at
-            FROM users 
-            ORDER BY id 
-            LIMIT ? OFFSET ?
-        ''', (per_page, offset)).fetchall()
-        
-        # Convert to list of dictionaries
-        customers_list = []
-        for customer in customers:
-            customers_list.append(dict(customer))
+        # Ranked matches from the full-text index, plus one row to tell if there is a next page
+        customers = conn.execute(queries.CUSTOMER_SEARCH, (match, per_page + 1, offset)).fetchall()
+        has_next = len(customers) > per_page
+        customers_list = Rows(customers[:per_page])
         
-        # Calculate pagination info
-        total_pages = (total_count + per_page - 1) // per_page
-        
-        conn.close()
+        total_count = total_pages = None
+        if get_bool_arg('include_total', True):
+            total_count = conn.execute(queries.CUSTOMER_SEARCH_COUNT, (match,)).fetchone()[0]
+            total_pages = (total_count + per_page - 1) // per_page
         
         return jsonify({
+            'query': query,
             'customers': customers_list,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
                 'total_count': total_count,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
+                'has_next': has_next,
                 'has_prev': page > 1
             }
         }), 200
         
     except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        return internal_error(e)
 
 @app.route('/api/customers/<int:customer_id>', methods=['GET'])
+@cached_endpoint(tables=('users', 'orders'), max_age=60)
 def get_customer_details(customer_id):
     """Get specific customer details including order count"""
+    return run_view(views.customer_details, customer_id)
+
+@app.route('/api/customers/<int:customer_id>/orders', methods=['GET'])
+@cached_endpoint(tables=('users', 'orders'), max_age=60)
+def get_customer_orders(customer_id):
+    """Get all orders for a specific customer"""
+    return run_view(views.customer_orders, customer_id)
+
+@app.route('/api/orders', methods=['GET'])
+@cached_endpoint(tables=('orders', 'users'))
+def get_all_orders():
+    """Get all orders with page or cursor pagination, filtered and sorted, or look up ?ids=1,2,3"""
+    return run_view(views.list_orders)
+
+@app.route('/api/orders/batch', methods=['POST'])
+def get_orders_batch():
+    """Get details for many orders in one request"""
+    return run_batch(views.orders_batch)
+
+@app.route('/api/orders/<int:order_id>', methods=['GET'])
+@cached_endpoint(tables=('orders', 'users'), max_age=60)
+def get_order_details(order_id):
+    """Get specific order details"""
+    return run_view(views.order_details, order_id)
+
+@app.route('/api/statistics', methods=['GET'])
+@cached_endpoint(tables=('orders',), max_age=30, private=False)
+def get_statistics():
+    """Get basic order statistics from the materialized store, or exactly with ?fresh=1"""
+    return run_view(views.statistics)
+
+@app.route('/api/analytics/orders/timeseries', methods=['GET'])
+@cached_endpoint(tables=('orders', 'users'), max_age=60)
+def get_orders_timeseries():
+    """Orders, items and shipped/delivered/returned rates per hour, day, week or month"""
+    try:
+        granularity, start, end, filters = parse_timeseries_args(request.args)
+    except InvalidAnalyticsQuery as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         conn = get_db_connection()
         
-        # Get customer details with order count
-        customer = conn.execute('''
-            SELECT u.id, u.first_name, u.last_name, u.email, u.age, u.gender,
-                   u.state, u.city, u.country, u.created_at,
-                   COUNT(o.order_id) as order_count
-            FROM users u
-            LEFT JOIN orders o ON u.id = o.user_id
-            WHERE u.id = ?
-            GROUP BY u.id
-        ''', (customer_id,)).fetchone()
-        
-        conn.close()
+        if granularity == 'hour':
+            # Finer than the rollup: aggregate the orders in the (capped) range directly
+            sql, params = hourly_query(start, end, filters)
+            source = 'orders'
+        else:
+            # Per-day sums from order_daily_rollup, folded into weeks or months here
+            sql, params = rollup_query(start, end, filters)
+            source = 'rollup'
         
-        if customer is None:
-            return jsonify({'error': 'Customer not found'}), 404
-        
-        # Convert to dictionary
-        customer_dict = dict(customer)
+        try:
+            series = build_series(conn.execute(sql, params), granularity, start, end)
+        except InvalidAnalyticsQuery as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
-            'customer': customer_dict
+            'granularity': granularity,
+            'start': start,
+            'end': end,
+            'filters': filters,
+            'source': source,
+            'series': series
         }), 200
         
     except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        return internal_error(e)
 
-@app.route('/api/customers/<int:customer_id>/orders', methods=['GET'])
-def get_customer_orders(customer_id):
-    """Get all orders for a specific customer"""
+@app.route('/api/analytics/fulfillment', methods=['GET'])
+@cached_endpoint(tables=('orders', 'users'), max_age=60)
+def get_fulfillment():
+    """Percentiles and histograms of time to ship, deliver and return, optionally per status or state"""
+    group_by = request.args.get('group_by')
+    if group_by is not None and group_by not in GROUP_BYS:
+        return jsonify({'error': f'group_by must be one of: {", ".join(GROUP_BYS)}'}), 400
+    
     try:
         conn = get_db_connection()
+        report = fulfillment.report(conn, group_by)
+        return jsonify({'group_by': group_by, **report}), 200
         
-        # First check if customer exists
-        customer_exists = conn.execute('SELECT id FROM users WHERE id = ?', (customer_id,)).fetchone()
-        if not customer_exists:
-            conn.close()
-            return jsonify({'error': 'Customer not found'}), 404
-        
-        # Get orders for the customer
-        orders = conn.execute('''
-            SELECT order_id, status, created_at, shipped_at, delivered_at, 
-                   returned_at, num_of_item
-            FROM orders 
-            WHERE user_id = ?
-            ORDER BY created_at DESC
-        ''', (customer_id,)).fetchall()
-        
-        conn.close()
-        
-        # Convert to list of dictionaries
-        orders_list = []
-        for order in orders:
-            orders_list.append(dict(order))
+    except Exception as e:
+        return internal_error(e)
+
+@app.route('/api/analytics/customers/top', methods=['GET'])
+@cached_endpoint(tables=('users', 'orders'), max_age=60)
+def get_top_customers():
+    """The customers with the most orders, items or returns, or the newest first/last orders"""
+    try:
+        metric = parse_metric(request.args)
+    except InvalidSegmentQuery as e:
+        return jsonify({'error': str(e)}), 400
+    limit = request.args.get('limit', 10, type=int)
+    if limit < 1 or limit > MAX_TOP:
+        return jsonify({'error': f'Limit must be between 1 and {MAX_TOP}'}), 400
+    
+    try:
+        conn = get_db_connection()
+        sql, params = top_query(metric, limit)
+        customers = Rows(conn.execute(sql, params).fetchall())
         
         return jsonify({
-            'customer_id': customer_id,
-            'orders': orders_list,
-            'total_orders': len(orders_list)
+            'by': metric,
+            'customers': customers
         }), 200
         
     except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        return internal_error(e)
 
-@app.route('/api/orders', methods=['GET'])
-def get_all_orders():
-    """Get all orders with pagination"""
+@app.route('/api/analytics/customers/segment', methods=['GET'])
+@cached_endpoint(tables=('users', 'orders'), max_age=60)
+def get_customer_segment():
+    """Customers whose order count, items, returns or order dates fall in [min, max]"""
+    try:
+        metric, low, high = parse_segment_args(request.args)
+    except InvalidSegmentQuery as e:
+        return jsonify({'error': str(e)}), 400
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    error = page_error(page, per_page)
+    if error:
+        return jsonify({'error': error}), 400
+    
     try:
-        # Get pagination parameters
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        # Validate parameters
-        if page < 1:
-            return jsonify({'error': 'Page number must be greater than 0'}), 400
-        if per_page < 1 or per_page > 100:
-            return jsonify({'error': 'Per page must be between 1 and 100'}), 400
-        
-        offset = (page - 1) * per_page
-        
         conn = get_db_connection()
         
-        # Get total count for pagination info
-        total_count = conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+        # One page in metric order off the metric's index, plus one row to tell if there is a next page
+        sql, params = segment_query(metric, low, high, per_page + 1, (page - 1) * per_page)
+        customers = conn.execute(sql, params).fetchall()
+        has_next = len(customers) > per_page
+        customers_list = Rows(customers[:per_page])
         
-        # Get orders with customer information
-        orders = conn.execute('''
-            SELECT o.order_id, o.user_id, o.status, o.created_at, o.shipped_at, 
-                   o.delivered_at, o.returned_at, o.num_of_item,
-                   u.first_name, u.last_name, u.email
-            FROM orders o
-            LEFT JOIN users u ON o.user_id = u.id
-            ORDER BY o.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (per_page, offset)).fetchall()
-        
-        # Convert to list of dictionaries
-        orders_list = []
-        for order in orders:
-            orders_list.append(dict(order))
-        
-        # Calculate pagination info
-        total_pages = (total_count + per_page - 1) // per_page
-        
-        conn.close()
+        total_count = total_pages = None
+        if get_bool_arg('include_total', True):
+            sql, params = segment_count_query(metric, low, high)
+            total_count = conn.execute(sql, params).fetchone()[0]
+            total_pages = (total_count + per_page - 1) // per_page
         
         return jsonify({
-            'orders': orders_list,
+            'by': metric,
+            'min': request.args.get('min'),
+            'max': request.args.get('max'),
+            'customers': customers_list,
             'pagination': {
                 'page': page,
                 'per_page': per_page,
                 'total_count': total_count,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
+                'has_next': has_next,
                 'has_prev': page > 1
             }
         }), 200
         
     except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        return internal_error(e)
 
-@app.route('/api/orders/<int:order_id>', methods=['GET'])
-def get_order_details(order_id):
-    """Get specific order details"""
+@app.route('/api/analytics/customers/cohorts', methods=['GET'])
+@cached_endpoint(tables=('users', 'orders'), max_age=60)
+def get_customer_cohorts():
+    """Customers grouped by the month of their first order, with their orders, items and returns"""
+    try:
+        start = parse_month(request.args, 'start')
+        end = parse_month(request.args, 'end')
+        if start and end and start >= end:
+            raise InvalidSegmentQuery('start must be before end')
+    except InvalidSegmentQuery as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         conn = get_db_connection()
-        
-        # Get order details with customer information
-        order = conn.execute('''
-            SELECT o.order_id, o.user_id, o.status, o.created_at, o.shipped_at, 
-                   o.delivered_at, o.returned_at, o.num_of_item,
-                   u.first_name, u.last_name, u.email
-            FROM orders o
-            LEFT JOIN users u ON o.user_id = u.id
-            WHERE o.order_id = ?
-        ''', (order_id,)).fetchone()
-        
-        conn.close()
-        
-        if order is None:
-            return jsonify({'error': 'Order not found'}), 404
-        
-        # Convert to dictionary
-        order_dict = dict(order)
+        sql, params = cohort_query(start, end)
+        cohorts = Rows(conn.execute(sql, params).fetchall())
         
         return jsonify({
-            'order': order_dict
+            'start': start,
+            'end': end,
+            'cohorts': cohorts
         }), 200
         
     except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        return internal_error(e)
 
-@app.route('/api/statistics', methods=['GET'])
-def get_statistics():
-    """Get basic order statistics"""
+def stream_export(name, columns, sql, params):
+    """Stream a query's rows as NDJSON or CSV, gzipped on request, in constant memory"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    
+    # The cursor is read with fetchmany() as the client consumes the response
+    cursor = get_db_connection().execute(sql, params)
+    encode = ndjson_chunks if export_format == 'ndjson' else csv_chunks
+    chunks = encode(cursor, columns)
+    
+    headers = {'Content-Disposition': f'attachment; filename={name}.{extension}'}
+    if get_bool_arg('gzip', False):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    
+    # stream_with_context keeps the request's pooled connection until the last chunk
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+@app.route('/api/export/orders', methods=['GET'])
+def export_orders():
+    """Export orders filtered by status, start/end date and user_id"""
     try:
-        conn = get_db_connection()
-        
-        # Get various statistics
-        stats = conn.execute('''
-            SELECT 
-                COUNT(DISTINCT user_id) as unique_customers,
-                COUNT(*) as total_orders,
-                AVG(num_of_item) as avg_items_per_order,
-                COUNT(CASE WHEN status = 'delivered' THEN 1 END) as delivered_orders,
-                COUNT(CASE WHEN status = 'returned' THEN 1 END) as returned_orders
-            FROM orders
-        ''').fetchone()
-        
-        conn.close()
-        
-        return jsonify({
-            'statistics': dict(stats)
-        }), 200
-        
+        sql, params = orders_export_query(request.args)
+        return stream_export('orders', ORDER_EXPORT_COLUMNS, sql, params)
+    except InvalidExportFilter as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        return internal_error(e)
+
+@app.route('/api/export/customers', methods=['GET'])
+def export_customers():
+    """Export customers filtered by state, country and start/end signup date"""
+    try:
+        sql, params = customers_export_query(request.args)
+        return stream_export('customers', CUSTOMER_EXPORT_COLUMNS, sql, params)
+    except InvalidExportFilter as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return internal_error(e)
+
+@app.route('/api/admin/pool', methods=['GET'])
+def get_pool_stats():
+    """Report database connection pool counters"""
+    return jsonify({'pool': db.pool.stats()}), 200
+
+@app.route('/api/admin/cache', methods=['GET'])
+def get_cache_stats():
+    """Report in-process cache sizes and hit/miss/eviction counters"""
+    return jsonify({
+        'entity_cache': entity_cache.stats(),
+        'count_cache': count_cache.stats(),
+        'fulfillment': fulfillment.stats(),
+        'compression': compressor.stats()
+    }), 200
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import http_date, parse_date, parse_etags
+
+from cache import CountCache, LRUCache
+from compression import MIN_SIZE, Compressor, negotiate, weak_etag
+from db import DATABASE, ConnectionPool, migrate_database
+from http_cache import etag_for, get_table_markers, last_modified_of
+from metrics import registry
+from serializers import dumps
+from views import CLIENT_ERRORS, Views
+
+# Production entry point: the read endpoints of app.py as async handlers.
+#   python asgi.py --workers 4            (or: uvicorn asgi:application --workers 4)
+# Each handler awaits its database work on a bounded set of threads with
+# read-only connections, so the event loop keeps accepting and answering
+# requests while queries run. Settings come from the environment so every
+# worker process of the server picks them up.
+
+# Threads running queries, each on its own pooled read-only connection
+DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', 8))
+
+# Requests that may wait for a free database thread; past that new ones get a 503
+MAX_QUEUED = int(os.environ.get('ASGI_MAX_QUEUED', 512))
+
+# Seconds a request's database work may run before its query is interrupted
+QUERY_TIMEOUT = float(os.environ.get('ASGI_QUERY_TIMEOUT', 10))
+
+# Seconds shutdown waits for requests in flight before closing connections
+SHUTDOWN_TIMEOUT = float(os.environ.get('ASGI_SHUTDOWN_TIMEOUT', 30))
+
+logger = logging.getLogger('api.asgi')
+
+class Unavailable(Exception):
+    """Raised when a request cannot be served right now; answered with a 503"""
+
+
+class DatabaseExecutor:
+    """Run blocking database work on a fixed number of threads
+
+    At most threads + max_queued calls are admitted at once; past that
+    run() fails fast with Unavailable instead of letting the backlog (and
+    every client's latency) grow. Work that runs longer than timeout has
+    its query interrupted, which frees the thread for other requests.
+    """
+
+    def __init__(self, pool, threads=DB_THREADS, max_queued=MAX_QUEUED, timeout=QUERY_TIMEOUT):
+        self.pool = pool
+        self.threads = threads
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='db')
+        self._admitted = asyncio.Semaphore(threads + max_queued)
+        # Only hand work to the executor when a thread is free, so the timeout
+        # measures running time rather than time spent queued
+        self._running = asyncio.Semaphore(threads)
+        self._stats = {'completed': 0, 'failed': 0, 'rejected': 0, 'timeouts': 0}
+
+    async def run(self, work, *args):
+        """Return work(conn, *args), called on a database thread"""
+        if self._admitted.locked():
+            self._stats['rejected'] += 1
+            raise Unavailable('Server busy, try again shortly')
+        async with self._admitted, self._running:
+            current = {'conn': None}
+            lock = threading.Lock()
+
+            def call():
+                conn = self.pool.acquire()
+                with lock:
+                    current['conn'] = conn
+                failed = False
+                try:
+                    return work(conn, *args)
+                except sqlite3.Error:
+                    failed = True
+                    raise
+                finally:
+                    with lock:
+                        current['conn'] = None
+                    self.pool.release(conn, discard=failed)
+
+            def interrupt():
+                with lock:
+                    if current['conn'] is not None:
+                        current['conn'].interrupt()
+
+            future = asyncio.get_running_loop().run_in_executor(self._executor, call)
+            # An interrupted call's error has no one left to read it
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                self._stats['timeouts'] += 1
+                interrupt()
+                # Hold the slot until the thread has actually given up
+                await asyncio.wait([future])
+                raise Unavailable(f'Query took longer than {self.timeout:g} seconds')
+            except asyncio.CancelledError:
+                # The client went away; stop its query rather than finish it for no one
+                interrupt()
+                raise
+            except Exception:
+                self._stats['failed'] += 1
+                raise
+            self._stats['completed'] += 1
+            return result
+
+    def shutdown(self):
+        """Wait for running work, then close every pooled connection"""
+        self._executor.shutdown(wait=True)
+        self.pool.close_all()
+
+    def stats(self):
+        """Return work counters and current limits"""
+        return dict(self._stats, threads=self.threads, max_queued=self.max_queued, timeout=self.timeout)
+
+
+class AsyncAPI:
+    """ASGI application serving the customer, order and statistics endpoints
+
+    The views are the ones app.py serves, from views.py, so both servers
+    return the same bodies, status codes and ETags and clients can move
+    between them.
+    """
+
+    def __init__(self, database=DATABASE):
+        self.database = database
+        self.executor = None
+        self.count_cache = CountCache()
+        self.entity_cache = LRUCache(
+            max_size=int(os.environ.get('ENTITY_CACHE_SIZE', 10000)),
+            ttl=int(os.environ.get('ENTITY_CACHE_TTL', 300))
+        )
+        self.compressor = Compressor(
+            min_size=int(os.environ.get('COMPRESS_MIN_SIZE', MIN_SIZE)),
+            max_bytes=int(os.environ.get('COMPRESS_STORE_BYTES', 64 * 1024 * 1024))
+        )
+        self.views = Views(self.count_cache, self.entity_cache)
+        self.closing = False
+        self.in_flight = 0
+        self._idle = None
+        self._start_lock = None
+
+        Route = namedtuple('Route', 'pattern view tables max_age private')
+        self.routes = [
+            Route(re.compile(r'/api/customers'), self.views.list_customers,
+                  lambda args: ('users', 'orders') if 'ids' in args else ('users',), 0, True),
+            Route(re.compile(r'/api/customers/(\d+)'), self.views.customer_details, ('users', 'orders'), 60, True),
+            Route(re.compile(r'/api/customers/(\d+)/orders'), self.views.customer_orders, ('users', 'orders'), 60, True),
+            Route(re.compile(r'/api/orders'), self.views.list_orders, ('orders', 'users'), 0, True),
+            Route(re.compile(r'/api/orders/(\d+)'), self.views.order_details, ('orders', 'users'), 60, True),
+            Route(re.compile(r'/api/statistics'), self.views.statistics, ('orders',), 30, False),
+            Route(re.compile(r'/metrics'), self.get_metrics, (), 0, True),
+        ]
+
+    # --- Lifecycle ---
+
+    def _prepare(self):
+        """Bring the schema up to date with a writable connection, then open the readers"""
+        migrate_database(self.database)
+        pool = ConnectionPool(self.database, max_idle=DB_THREADS, read_only=True)
+        pool.prepare(warm=DB_THREADS)
+        return pool
+
+    async def startup(self):
+        """Open the database threads; also run on first request if the server has no lifespan"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.executor is None:
+                pool = await asyncio.get_running_loop().run_in_executor(None, self._prepare)
+                self._idle = asyncio.Event()
+                self._idle.set()
+                self.executor = DatabaseExecutor(pool)
+
+    async def shutdown(self):
+        """Refuse new requests, let the ones in flight finish, then close the connections"""
+        self.closing = True
+        if self.executor is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def lifespan(self, receive, send):
+        """Handle the server's startup and shutdown messages"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- Requests ---
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            started = time.perf_counter()
+            route, match = self.match(scope['path'])
+            self.in_flight += 1
+            if self._idle is not None:
+                self._idle.clear()
+            try:
+                status, headers, body = await self.handle(scope, route, match)
+            finally:
+                self.in_flight -= 1
+                if self.in_flight == 0 and self._idle is not None:
+                    self._idle.set()
+            registry.observe_request(route.view.__name__ if route else None, scope['method'], status,
+                                     time.perf_counter() - started)
+            headers.append((b'content-length', str(len(body)).encode('ascii')))
+            headers.append((b'access-control-allow-origin', b'*'))
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+    def match(self, path):
+        """The route serving path and its match, or (None, None)"""
+        for route in self.routes:
+            match = route.pattern.fullmatch(path)
+            if match:
+                return route, match
+        return None, None
+
+    async def handle(self, scope, route, match):
+        """Answer a routed request with (status, headers, body)"""
+        if route is None:
+            return error_response(404, 'Endpoint not found')
+
+        method = scope['method']
+        if method == 'OPTIONS':
+            return preflight_response(scope)
+        if method not in ('GET', 'HEAD'):
+            return error_response(405, 'Method not allowed')
+        if route.view == self.get_metrics:
+            return 200, [(b'content-type', b'text/plain; version=0.0.4')], registry.render().encode('utf-8')
+        if self.closing:
+            return error_response(503, 'Server is shutting down')
+        if self.executor is None:
+            await self.startup()
+
+        args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        request_headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                           for name, value in scope['headers']}
+        path = scope['path']
+        ids = [int(value) for value in match.groups()]
+        try:
+            return await self.executor.run(self.respond, route, path, args, request_headers, ids)
+        except Unavailable as e:
+            return error_response(503, str(e))
+        except Exception as e:
+            logger.exception('Unhandled error in %s %s', scope['method'], path)
+            registry.count_error(route.view.__name__)
+            return error_response(500, f'Internal server error: {str(e)}')
+
+    def respond(self, conn, route, path, args, request_headers, ids):
+        """Answer from validators with a 304, or run the view; called on a database thread"""
+        tables = route.tables(args) if callable(route.tables) else route.tables
+        markers = get_table_markers(conn, tables)
+        etag = etag_for(path, args.items(multi=True), markers, conn.generation)
+        last_modified = last_modified_of(markers)
+
+        if is_not_modified(request_headers, etag, last_modified):
+            status, body = 304, b''
+        else:
+            try:
+                payload, status = route.view(conn, args, *ids)
+            except CLIENT_ERRORS as e:
+                payload, status = {'error': str(e)}, 400
+            body = json_body(payload)
+            if status != 200:
+                return status, [(b'content-type', b'application/json')], body
+
+        cache_control = [f'max-age={route.max_age}', 'private' if route.private else 'public']
+        if route.max_age == 0:
+            # Always revalidate; the 304 path is cheap
+            cache_control.append('must-revalidate')
+        etag = f'"{etag}"'
+        headers = [(b'cache-control', ', '.join(cache_control).encode('ascii'))]
+        if last_modified:
+            headers.append((b'last-modified', http_date(last_modified).encode('ascii')))
+        if status == 200:
+            headers.append((b'content-type', b'application/json'))
+            if len(body) >= self.compressor.min_size:
+                headers.append((b'vary', b'Accept-Encoding'))
+                coding = negotiate(request_headers.get('accept-encoding'))
+                if coding is not None:
+                    body = self.compressor.compress(route.view.__name__, body, coding, etag)
+                    headers.append((b'content-encoding', coding.encode('ascii')))
+                    etag = weak_etag(etag)
+        headers.append((b'etag', etag.encode('ascii')))
+        return status, headers, body
+
+    # --- Views: the rest are in views.py ---
+
+    def get_metrics(self):
+        """Prometheus scrape endpoint; answered on the event loop, see handle()"""
+
+
+def json_body(payload):
+    """Encode a response body exactly as Flask's jsonify does outside debug mode"""
+    return (dumps(payload) + '\n').encode('ascii')
+
+
+def error_response(status, message):
+    """(status, headers, body) for a JSON error"""
+    return status, [(b'content-type', b'application/json')], json_body({'error': message})
+
+
+def preflight_response(scope):
+    """Answer a CORS preflight for the read endpoints"""
+    headers = [(b'access-control-allow-methods', b'GET, HEAD, OPTIONS')]
+    for name, value in scope['headers']:
+        if name.lower() == b'access-control-request-headers':
+            headers.append((b'access-control-allow-headers', value))
+    return 200, headers, b''
+
+
+def is_not_modified(request_headers, etag, last_modified):
+    """Check the request's validators, preferring If-None-Match as HTTP requires"""
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(etag)
+    since = parse_date(request_headers.get('if-modified-since'))
+    if since and last_modified:
+        return last_modified <= since
+    return False
+
+
+application = AsyncAPI()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the read API over ASGI with uvicorn')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='server processes, each with its own event loop and database threads')
+    parser.add_argument('--db-threads', type=int, default=DB_THREADS,
+                        help='database threads (and read-only connections) per process')
+    parser.add_argument('--max-queued', type=int, default=MAX_QUEUED,
+                        help='requests per process that may wait for a database thread before 503s')
+    parser.add_argument('--limit-concurrency', type=int, default=None,
+                        help='open connections per process before the server answers 503')
+    parser.add_argument('--query-timeout', type=float, default=QUERY_TIMEOUT,
+                        help='seconds before a query is interrupted')
+    args = parser.parse_args()
+
+    import uvicorn
+
+    # Worker processes import this module afresh and read their settings from here
+    os.environ['ASGI_DB_THREADS'] = str(args.db_threads)
+    os.environ['ASGI_MAX_QUEUED'] = str(args.max_queued)
+    os.environ['ASGI_QUERY_TIMEOUT'] = str(args.query_timeout)
+    uvicorn.run('asgi:application', host=args.host, port=args.port, workers=args.workers,
+                limit_concurrency=args.limit_concurrency, lifespan='on')
@@ -0,0 +1,458 @@
+import argparse
+import contextlib
+import gzip
+import http.client
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+# Load test for the API: build (or reuse) a synthetic database of a given
+# size, serve it, drive it with concurrent clients and report throughput and
+# latency percentiles as JSON, so runs on two commits can be compared.
+#   python bench_api.py --orders 1000000 --concurrency 1,8,32 --output before.json
+#   python bench_api.py --orders 1000000 --concurrency 1,8,32 --compare before.json
+# Clients are separate processes with one keep-alive connection each, sending
+# their next request as soon as the last one is answered (a closed loop).
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Request kinds, weighted per traffic mix. Ids are drawn uniformly, so the
+# response caches see roughly the hit rate a large, evenly browsed catalogue gives.
+MIXES = {
+    'mixed': {
+        'customer_detail': 25, 'order_detail': 20, 'customer_orders': 20, 'orders_cursor': 10,
+        'orders_page': 10, 'customers_page': 10, 'statistics': 5,
+    },
+    'browse': {'orders_page': 40, 'customers_page': 30, 'orders_cursor': 30},
+    'lookup': {'customer_detail': 40, 'order_detail': 30, 'customer_orders': 30},
+    'statistics': {'statistics': 1},
+}
+
+PER_PAGE = 20
+
+# Pages a client follows through next_cursor before starting from the top again
+CURSOR_DEPTH = 50
+
+
+class Dataset:
+    """Row counts of the database under test; ids run from 1 to the count"""
+
+    def __init__(self, users, orders):
+        self.users = users
+        self.orders = orders
+
+
+def deep_page(rng, rows):
+    """A page number anywhere in the listing, the deep end as likely as the first pages"""
+    return rng.randint(1, max(1, (rows + PER_PAGE - 1) // PER_PAGE))
+
+
+def next_path(kind, rng, dataset, state):
+    """The path of the next request of a kind; state carries a client's open cursor"""
+    if kind == 'customer_detail':
+        return f'/api/customers/{rng.randint(1, dataset.users)}'
+    if kind == 'order_detail':
+        return f'/api/orders/{rng.randint(1, dataset.orders)}'
+    if kind == 'customer_orders':
+        return f'/api/customers/{rng.randint(1, dataset.users)}/orders'
+    if kind == 'customers_page':
+        return f'/api/customers?page={deep_page(rng, dataset.users)}&per_page={PER_PAGE}'
+    if kind == 'orders_page':
+        return f'/api/orders?page={deep_page(rng, dataset.orders)}&per_page={PER_PAGE}'
+    if kind == 'orders_cursor':
+        # An empty cursor asks for the first page in keyset mode
+        return f'/api/orders?per_page={PER_PAGE}&cursor={urllib.parse.quote(state.get("cursor") or "")}'
+    if kind == 'statistics':
+        return '/api/statistics'
+    raise ValueError(f'Unknown request kind: {kind}')
+
+
+def parse_mix(value):
+    """A mix by name, or kind=weight pairs such as customer_detail=3,statistics=1"""
+    if '=' not in value:
+        if value not in MIXES:
+            raise argparse.ArgumentTypeError(f'unknown mix {value!r}; choose from {", ".join(MIXES)}')
+        return value, MIXES[value]
+    weights = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in MIXES['mixed']:
+            raise argparse.ArgumentTypeError(f'unknown request kind {kind!r}')
+        try:
+            weights[kind] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid weight for {kind}: {weight!r}')
+    return value, weights
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(latencies):
+    """Latency percentiles in milliseconds"""
+    ordered = sorted(latencies)
+    if not ordered:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    return {
+        'p50': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99': round(percentile(ordered, 0.99) * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def run_client(number, host, port, dataset, weights, warmup, duration, accept_encoding, seed, barrier, results):
+    """One closed-loop client; runs in its own process and puts its timings on results"""
+    rng = random.Random(seed * 1000003 + number)
+    kinds, cumulative = list(weights), []
+    total = 0
+    for kind in kinds:
+        total += weights[kind]
+        cumulative.append(total)
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+
+    latencies = {kind: [] for kind in kinds}
+    statuses = {}
+    errors = 0
+    state = {'cursor': None, 'depth': 0}
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    barrier.wait()
+    started = time.perf_counter()
+    measure_from, stop_at = started + warmup, started + warmup + duration
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            break
+        kind = rng.choices(kinds, cum_weights=cumulative)[0]
+        path = next_path(kind, rng, dataset, state)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # Drop the connection and count the failure; the next request reconnects
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+            status = None
+        elapsed = time.perf_counter() - now
+
+        if kind == 'orders_cursor':
+            state['cursor'], state['depth'] = None, state['depth'] + 1
+            if status == 200 and state['depth'] < CURSOR_DEPTH:
+                if response.getheader('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                state['cursor'] = json.loads(body)['pagination']['next_cursor']
+            if state['cursor'] is None:
+                state['depth'] = 0
+
+        if now < measure_from:
+            continue
+        latencies[kind].append(elapsed)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status is None or status >= 500:
+            errors += 1
+    conn.close()
+    results.put((latencies, statuses, errors))
+
+
+def run_level(host, port, dataset, weights, concurrency, options):
+    """Drive the server with concurrency clients; returns the merged timings"""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(concurrency + 1)
+    results = context.Queue()
+    clients = [
+        context.Process(target=run_client, args=(
+            number, host, port, dataset, weights, options.warmup, options.duration,
+            options.accept_encoding, options.seed, barrier, results))
+        for number in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    # Starting processes takes a while; nobody sends until all of them are up
+    barrier.wait()
+
+    latencies = {kind: [] for kind in weights}
+    statuses, errors = {}, 0
+    for _ in clients:
+        client_latencies, client_statuses, client_errors = results.get()
+        for kind, values in client_latencies.items():
+            latencies[kind] += values
+        for status, count in client_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+        errors += client_errors
+    for client in clients:
+        client.join()
+    return latencies, statuses, errors
+
+
+def report(mix, concurrency, duration, latencies, statuses, errors):
+    """One result entry: throughput and latency, overall and per request kind"""
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        'mix': mix,
+        'concurrency': concurrency,
+        'duration': duration,
+        'requests': len(everything),
+        'errors': errors,
+        'statuses': dict(sorted(statuses.items())),
+        'throughput': round(len(everything) / duration, 1),
+        'latency_ms': summarize(everything),
+        'kinds': {
+            kind: dict(requests=len(values), throughput=round(len(values) / duration, 1), latency_ms=summarize(values))
+            for kind, values in sorted(latencies.items())
+        },
+    }
+
+
+def build_database(directory, users, orders):
+    """Generate and load a synthetic dataset into directory/ecommerce.db, unless it is there already"""
+    # Imported here: --url runs do not need pandas
+    from load_data import bulk_load
+    from migrations import migrate
+    from synthetic_data import write_dataset
+
+    database = os.path.join(directory, 'ecommerce.db')
+    if os.path.exists(database):
+        return database
+    os.makedirs(directory, exist_ok=True)
+    partial = database + '.partial'
+    with tempfile.TemporaryDirectory() as scratch:
+        log(f"Generating {users:,} users and {orders:,} orders...")
+        users_csv, orders_csv = write_dataset(scratch, users, orders)
+        log("Loading...")
+        conn = sqlite3.connect(partial)
+        migrate(conn)
+        with contextlib.redirect_stdout(io.StringIO()):
+            bulk_load(conn, users_csv, orders_csv)
+        conn.close()
+    # Renamed only when complete, so an interrupted build is not reused
+    os.replace(partial, database)
+    return database
+
+
+def serve_in_process(database):
+    """Serve app.py from a thread of this process; returns (host, port, stop)"""
+    import db
+    db.pool.database = database
+    # Imported after the pool is pointed at the benchmark database
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    return '127.0.0.1', server.server_port, stop
+
+
+def free_port():
+    """A TCP port nothing is listening on right now"""
+    import socket
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def serve_workers(database, workers):
+    """Run serve.py on the benchmark database in a subprocess; returns (host, port, stop)"""
+    port = free_port()
+    # serve.py opens ecommerce.db in its working directory
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'serve.py'), '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers)],
+        cwd=os.path.dirname(database), stdout=subprocess.DEVNULL,
+    )
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=60)
+    return '127.0.0.1', port, stop
+
+
+def wait_until_ready(host, port, timeout=120):
+    """Block until the server answers, or raise after timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request('GET', '/api/statistics')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'Server on {host}:{port} did not answer within {timeout}s')
+        time.sleep(0.2)
+
+
+def count_rows(host, port, path):
+    """total_count of a paginated listing"""
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    conn.request('GET', f'{path}?per_page=1')
+    response = conn.getresponse()
+    body = json.loads(response.read())
+    conn.close()
+    return body['pagination']['total_count']
+
+
+def current_commit():
+    """The checked-out commit, marked -dirty with uncommitted changes; None outside git"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=HERE,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline run; returns the regressions found"""
+    previous = {(entry['mix'], entry['concurrency']): entry for entry in baseline['results']}
+    regressions = []
+    log(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    log(f"{'mix':>12} {'clients':>8} {'req/s':>20} {'p95 ms':>20} {'p99 ms':>20}")
+    for entry in results:
+        before = previous.get((entry['mix'], entry['concurrency']))
+        if before is None:
+            continue
+        changes = {
+            'throughput': entry['throughput'] / before['throughput'] - 1 if before['throughput'] else 0.0,
+            'p95': entry['latency_ms']['p95'] / before['latency_ms']['p95'] - 1 if before['latency_ms']['p95'] else 0.0,
+            'p99': entry['latency_ms']['p99'] / before['latency_ms']['p99'] - 1 if before['latency_ms']['p99'] else 0.0,
+        }
+        cells = [
+            f"{before['throughput']:.0f} → {entry['throughput']:.0f} ({changes['throughput']:+.0%})",
+            f"{before['latency_ms']['p95']:.1f} → {entry['latency_ms']['p95']:.1f} ({changes['p95']:+.0%})",
+            f"{before['latency_ms']['p99']:.1f} → {entry['latency_ms']['p99']:.1f} ({changes['p99']:+.0%})",
+        ]
+        log(f"{entry['mix']:>12} {entry['concurrency']:>8} " + ' '.join(f'{cell:>20}' for cell in cells))
+        # Throughput falling or p95 rising by more than the tolerance counts; p99 is too noisy to gate on
+        if changes['throughput'] < -tolerance or changes['p95'] > tolerance:
+            regressions.append((entry['mix'], entry['concurrency'], changes))
+    return regressions
+
+
+def log(message):
+    """Progress goes to stderr; stdout is left for the JSON report"""
+    print(message, file=sys.stderr, flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the API and report throughput and latency as JSON')
+    parser.add_argument('--users', type=int, default=None, help='synthetic customers (default: orders * 0.8)')
+    parser.add_argument('--orders', type=int, default=125000, help='synthetic orders, e.g. 100000 to 10000000')
+    parser.add_argument('--data-dir', default=os.path.join(HERE, 'bench_data'),
+                        help='where generated databases are kept and reused between runs')
+    parser.add_argument('--server', choices=('inprocess', 'serve'), default='inprocess',
+                        help='inprocess: app.py on a thread of this process; serve: serve.py with --workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='serve.py worker processes')
+    parser.add_argument('--url', help='benchmark an already running server instead, e.g. http://localhost:5000')
+    parser.add_argument('--mix', type=parse_mix, action='append',
+                        help=f'traffic mix, repeatable: {", ".join(MIXES)} or kind=weight,... (default: mixed)')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds measured per mix and client count')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of traffic before measuring starts')
+    parser.add_argument('--accept-encoding', default='gzip', help="clients' Accept-Encoding; '' for none")
+    parser.add_argument('--seed', type=int, default=1, help='seed for the request sequence')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=10,
+                        help='percent drop in throughput or rise in p95 that counts as a regression')
+    args = parser.parse_args()
+
+    mixes = args.mix or [('mixed', MIXES['mixed'])]
+    levels = [int(count) for count in args.concurrency.split(',')]
+
+    stop = None
+    if args.url:
+        target = urllib.parse.urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+        server = args.url
+    else:
+        users = args.users if args.users is not None else int(args.orders * 0.8)
+        database = build_database(os.path.join(args.data_dir, f'{users}x{args.orders}'), users, args.orders)
+        if args.server == 'serve':
+            host, port, stop = serve_workers(database, args.workers)
+            server = f'serve.py --workers {args.workers}'
+        else:
+            host, port, stop = serve_in_process(database)
+            server = 'inprocess'
+
+    try:
+        wait_until_ready(host, port)
+        dataset = Dataset(count_rows(host, port, '/api/customers'),
+                          count_rows(host, port, '/api/orders'))
+        log(f"Benchmarking {server} with {dataset.users:,} customers and {dataset.orders:,} orders")
+        log(f"{'mix':>12} {'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+        results = []
+        for name, weights in mixes:
+            for concurrency in levels:
+                latencies, statuses, errors = run_level(host, port, dataset, weights, concurrency, args)
+                entry = report(name, concurrency, args.duration, latencies, statuses, errors)
+                results.append(entry)
+                latency = entry['latency_ms']
+                log(f"{name:>12} {concurrency:>8} {entry['requests']:>9} {errors:>7} {entry['throughput']:>9.1f} "
+                    f"{latency['p50'] or 0:>8.2f} {latency['p95'] or 0:>8.2f} {latency['p99'] or 0:>8.2f}")
+    finally:
+        if stop is not None:
+            stop()
+
+    document = {
+        'commit': current_commit(),
+        'started_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'server': server,
+        'dataset': {'users': dataset.users, 'orders': dataset.orders},
+        'environment': {
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'cpus': os.cpu_count(), 'platform': platform.platform(),
+        },
+        'settings': {
+            'duration': args.duration, 'warmup': args.warmup, 'per_page': PER_PAGE,
+            'accept_encoding': args.accept_encoding, 'seed': args.seed,
+            'mixes': {name: weights for name, weights in mixes},
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+        log(f"Wrote {args.output}")
+    else:
+        print(json.dumps(document, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance / 100)
+        if regressions:
+            log(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:g}%")
+            sys.exit(1)
+        log(f"✅ No regressions beyond {args.tolerance:g}%")
@@ -0,0 +1,58 @@
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+
+from load_data import bulk_load
+from migrations import migrate
+from synthetic_data import write_dataset
+
+
+def time_load(users_csv, orders_csv, database, workers, chunk_size):
+    """Load the CSVs into a fresh database; returns seconds taken and rows loaded"""
+    conn = sqlite3.connect(database)
+    migrate(conn)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        bulk_load(conn, users_csv, orders_csv, chunk_size, workers)
+    elapsed = time.perf_counter() - started
+    rows = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ('users', 'orders'))
+    conn.close()
+    return elapsed, rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare single-process and parallel CSV loading')
+    parser.add_argument('--users', type=int, default=200000, help='synthetic customers to generate')
+    parser.add_argument('--orders', type=int, default=250000, help='synthetic orders to generate')
+    parser.add_argument('--workers', default=None,
+                        help='comma-separated worker counts (default: 1, 2, 4 ... up to the CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='rows per chunk for 1 worker')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per worker count; the best is kept')
+    args = parser.parse_args()
+
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(',')]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+            worker_counts.append(worker_counts[-1] * 2)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Generating {args.users:,} users and {args.orders:,} orders...")
+        users_csv, orders_csv = write_dataset(directory, args.users, args.orders)
+
+        print(f"{'workers':>8} {'seconds':>9} {'rows/sec':>12} {'speedup':>8}")
+        baseline = None
+        for workers in worker_counts:
+            best = None
+            for run in range(args.repeat):
+                database = os.path.join(directory, f'bench_{workers}_{run}.db')
+                elapsed, rows = time_load(users_csv, orders_csv, database, workers, args.chunk_size)
+                os.remove(database)
+                best = elapsed if best is None else min(best, elapsed)
+            baseline = baseline or best
+            print(f"{workers:>8} {best:>9.2f} {rows / best:>12,.0f} {baseline / best:>7.2f}x")
@@ -0,0 +1,293 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Change counters are bumped by triggers on every write (see migrations.py)
+TABLE_VERSION = 'SELECT version FROM table_versions WHERE table_name = ?'
+
+# Triggers also append each written customer/order to change_log (see migrations.py)
+CHANGE_LOG_BOUNDS = 'SELECT (SELECT MIN(seq) FROM change_log), (SELECT MAX(seq) FROM change_log)'
+CHANGES_SINCE = 'SELECT entity, entity_id FROM change_log WHERE seq > ? AND seq <= ?'
+
+# Past this many changes, evicting key by key costs more than starting over
+MAX_TARGETED_CHANGES = 5000
+
+# Returned by LRUCache.get when a key is not cached, since None is a valid value
+MISSING = object()
+
+
+def get_table_version(conn, table):
+    """Return the change counter of a table"""
+    return conn.execute(TABLE_VERSION, (table,)).fetchone()[0]
+
+
+def get_changes(conn, since, limit=MAX_TARGETED_CHANGES):
+    """Return (latest change seq, entities changed after seq since)
+
+    The entities are a set of (entity, id) tags, or None when the caller
+    should drop everything: on first use, after a bulk load, or when the
+    log no longer reaches back to since.
+    """
+    first, latest = conn.execute(CHANGE_LOG_BOUNDS).fetchone()
+    latest = latest or 0
+    if since == latest:
+        return latest, set()
+    if since is None or since > latest or (first or 0) > since + 1 or latest - since > limit:
+        return latest, None
+    changed = set()
+    for entity, entity_id in conn.execute(CHANGES_SINCE, (since, latest)):
+        if entity == '*':
+            return latest, None
+        changed.add((entity, entity_id))
+    return latest, changed
+
+
+class CountCache:
+    """Remember COUNT(*) per table until the table's change counter moves"""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, table, count_sql):
+        """Return the row count of a table, recounting only after a write"""
+        # Read the version first: a write landing mid-count leaves a stale
+        # version behind, which only forces one extra recount later. A
+        # swapped-in snapshot may reuse version numbers, hence the generation.
+        version = (getattr(conn, 'generation', None), get_table_version(conn, table))
+        with self._lock:
+            cached = self._counts.get(table)
+            if cached is not None and cached[0] == version:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        count = conn.execute(count_sql).fetchone()[0]
+        with self._lock:
+            self._counts[table] = (version, count)
+        return count
+
+    def clear(self):
+        """Forget every cached count"""
+        with self._lock:
+            self._counts.clear()
+
+    def stats(self):
+        """Return hit/miss counters"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'tables': len(self._counts)}
+
+
+class LRUCache:
+    """Bounded cache that evicts the least recently used entry and expires old ones
+
+    Entries are tagged with the data version they were read at, plus the
+    entities they were built from. sync() moves the cache to a newer
+    version, dropping only the entries whose entities changed when it is
+    told which did, and everything otherwise. A set() carrying another
+    version is ignored, so a slow reader cannot store data that predates
+    the changes already applied.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tagged = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'targeted_invalidations': 0,
+        }
+
+    def sync(self, version, changed=None, since=None):
+        """Catch up with a new data version
+
+        changed holds the tags written between versions since and version.
+        Versions only move forward on this path, so a caller that raced
+        behind another has nothing left to apply; one whose since no longer
+        matches the cache cannot say what changed, so everything is dropped.
+        """
+        with self._lock:
+            current = self._version
+            if changed is not None and current is not None:
+                if version <= current:
+                    return
+                if since == current:
+                    for tag in changed:
+                        for key in self._tagged.pop(tag, ()):
+                            self._discard(key)
+                            self._counters['targeted_invalidations'] += 1
+                    self._version = version
+                    return
+            if self._entries:
+                self._counters['invalidations'] += 1
+            self._entries.clear()
+            self._tagged.clear()
+            self._version = version
+
+    @property
+    def version(self):
+        """The data version the cached entries are valid for"""
+        return self._version
+
+    def get(self, key):
+        """Return the cached value for key, or MISSING"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return MISSING
+            value, expires_at, _ = entry
+            if expires_at <= now:
+                self._discard(key)
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return value
+
+    def set(self, key, value, version, tags=()):
+        """Store a value read at the given data version, built from the tagged entities"""
+        with self._lock:
+            if version != self._version:
+                return
+            self._discard(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    def _discard(self, key):
+        """Remove an entry and its tag references; the lock must be held"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def clear(self):
+        """Forget every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._tagged.clear()
+
+    def stats(self):
+        """Return the size, limits and hit/miss/eviction counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else None
+        stats['max_size'] = self.max_size
+        stats['ttl'] = self.ttl
+        return stats
+
+
+# Most ids a single batch lookup may ask for
+BATCH_LIMIT = 500
+
+
+class InvalidBatch(ValueError):
+    """Raised when a batch lookup request does not carry a usable list of ids"""
+
+
+def check_batch_ids(ids):
+    """Drop duplicate ids, keeping the first of each, and enforce the batch size limits"""
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise InvalidBatch('At least one id is required')
+    if len(ids) > BATCH_LIMIT:
+        raise InvalidBatch(f'At most {BATCH_LIMIT} ids per request')
+    return ids
+
+
+def parse_ids_arg(value):
+    """Read a ?ids=1,2,3 query parameter"""
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise InvalidBatch('ids must be a comma-separated list of integers')
+    return check_batch_ids(ids)
+
+
+def sync_entity_cache(cache, conn):
+    """Evict the cached entries whose rows changed since the last request; returns the version
+
+    Versions are (database file, change_log seq): after a snapshot swap the
+    seq of the new file says nothing about the old one, so everything goes.
+    """
+    since = cache.version
+    if since is not None and since[0] == conn.generation:
+        seq, changed = get_changes(conn, since[1])
+    else:
+        seq, changed = get_changes(conn, None)
+    version = (conn.generation, seq)
+    cache.sync(version, changed, since)
+    return version
+
+
+def entity_tags(key, value):
+    """The customer and order rows a cached entry was built from"""
+    kind, entity_id = key
+    if kind == 'order':
+        # Order details include the customer's name and email
+        if value is not None and value.get('user_id') is not None:
+            return (('order', entity_id), ('user', value['user_id']))
+        return (('order', entity_id),)
+    return (('user', entity_id),)
+
+
+def cached_lookup(cache, conn, key, load):
+    """Return load() through the entity cache, tagged with the current data version"""
+    version = sync_entity_cache(cache, conn)
+    value = cache.get(key)
+    if value is MISSING:
+        value = load()
+        cache.set(key, value, version, entity_tags(key, value))
+    return value
+
+
+def batch_lookup(cache, conn, kind, ids, sql, id_column):
+    """Resolve ids through the entity cache, loading every miss with one query
+
+    Returns the found rows in the order requested, and the ids that do not exist.
+    """
+    version = sync_entity_cache(cache, conn)
+
+    found = {}
+    missing = []
+    for entity_id in ids:
+        value = cache.get((kind, entity_id))
+        if value is MISSING:
+            missing.append(entity_id)
+        else:
+            found[entity_id] = value
+
+    if missing:
+        rows = conn.execute(sql, (json.dumps(missing),)).fetchall()
+        loaded = {row[id_column]: dict(row) for row in rows}
+        for entity_id in missing:
+            found[entity_id] = loaded.get(entity_id)
+            key = (kind, entity_id)
+            cache.set(key, found[entity_id], version, entity_tags(key, found[entity_id]))
+
+    rows = [found[entity_id] for entity_id in ids if found[entity_id] is not None]
+    not_found = [entity_id for entity_id in ids if found[entity_id] is None]
+    return rows, not_found
@@ -0,0 +1,181 @@
+import gzip
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this go out as they are; compressing them saves
+# less than the Content-Encoding header and the CPU cost
+MIN_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Only text compresses well; images or archives would just burn CPU
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+ENCODERS = {'gzip': lambda body: gzip.compress(body, GZIP_LEVEL, mtime=0)}
+if brotli is not None:
+    ENCODERS['br'] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+
+# Preferred first when the client accepts several equally
+PREFERENCE = ('br', 'gzip')
+
+
+def parse_accept_encoding(header):
+    """Map each coding in an Accept-Encoding header to its q value"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def negotiate(header):
+    """The coding to compress with for an Accept-Encoding header, or None"""
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for coding in PREFERENCE:
+        if coding not in ENCODERS:
+            continue
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def is_compressible(mimetype):
+    """True for the text formats worth compressing"""
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def weak_etag(etag):
+    """The ETag of a compressed body; the bytes differ, the content does not"""
+    return etag if etag.startswith('W/') else f'W/{etag}'
+
+
+class Compressor:
+    """Compress response bodies, keeping the output for bodies with an ETag
+
+    An ETag names one exact body (path, parameters and data version), so
+    its compressed bytes can be served again until the data changes and
+    the ETag with it. The store is bounded by total compressed size and
+    drops the least recently used entries. Counters are kept per endpoint.
+    """
+
+    def __init__(self, min_size=MIN_SIZE, max_bytes=64 * 1024 * 1024):
+        self.min_size = min_size
+        self.max_bytes = max_bytes
+        self._store = OrderedDict()
+        self._stored_bytes = 0
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def compress(self, endpoint, body, coding, etag=None):
+        """Return body compressed with coding, from the store when it holds it"""
+        key = (etag, coding)
+        if etag is not None:
+            with self._lock:
+                compressed = self._store.get(key)
+                if compressed is not None:
+                    self._store.move_to_end(key)
+                    self._counters['hits'] += 1
+                    self._count(endpoint, coding, len(body), len(compressed), 0.0, cached=True)
+                    return compressed
+
+        # Thread CPU time, so time spent waiting on other requests is not counted
+        started = time.thread_time()
+        compressed = ENCODERS[coding](body)
+        cpu = time.thread_time() - started
+
+        with self._lock:
+            self._count(endpoint, coding, len(body), len(compressed), cpu, cached=False)
+            if etag is not None:
+                self._counters['misses'] += 1
+                if key not in self._store and len(compressed) <= self.max_bytes:
+                    self._store[key] = compressed
+                    self._stored_bytes += len(compressed)
+                    while self._stored_bytes > self.max_bytes:
+                        _, evicted = self._store.popitem(last=False)
+                        self._stored_bytes -= len(evicted)
+                        self._counters['evictions'] += 1
+        return compressed
+
+    def _count(self, endpoint, coding, size, compressed_size, cpu, cached):
+        """Add one response to its endpoint's counters; caller holds the lock"""
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = {
+                'responses': 0, 'from_store': 0, 'bytes_in': 0, 'bytes_out': 0,
+                'cpu_seconds': 0.0, 'codings': {},
+            }
+        stats['responses'] += 1
+        stats['from_store'] += cached
+        stats['bytes_in'] += size
+        stats['bytes_out'] += compressed_size
+        stats['cpu_seconds'] += cpu
+        stats['codings'][coding] = stats['codings'].get(coding, 0) + 1
+
+    def stats(self):
+        """Return store counters and bytes saved and CPU time per endpoint"""
+        with self._lock:
+            endpoints = {
+                name: dict(
+                    stats,
+                    codings=dict(stats['codings']),
+                    bytes_saved=stats['bytes_in'] - stats['bytes_out'],
+                    cpu_seconds=round(stats['cpu_seconds'], 6),
+                )
+                for name, stats in self._endpoints.items()
+            }
+            return dict(
+                self._counters,
+                entries=len(self._store),
+                stored_bytes=self._stored_bytes,
+                max_bytes=self.max_bytes,
+                min_size=self.min_size,
+                codings=list(ENCODERS),
+                endpoints=endpoints,
+            )
+
+
+def init_app(app, compressor):
+    """Compress the app's responses for clients that accept it"""
+    @app.after_request
+    def compress_response(response):
+        # Streams (exports) set their own encoding, and are not held in memory
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+            return response
+        body = response.get_data()
+        if len(body) < compressor.min_size:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        coding = negotiate(request.headers.get('Accept-Encoding'))
+        if coding is None:
+            return response
+
+        etag = response.headers.get('ETag')
+        response.set_data(compressor.compress(request.endpoint, body, coding, etag))
+        response.headers['Content-Encoding'] = coding
+        if etag:
+            response.headers['ETag'] = weak_etag(etag)
+        return response
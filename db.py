@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import threading
+import atexit
+from flask import g
+import migrations
+from metrics import TimedCursor
+
+DATABASE = 'ecommerce.db'
+
+# Applied to every connection as soon as it is opened
+CONNECTION_PRAGMAS = [
+    ('mmap_size', 268435456),   # memory-map up to 256 MB of the database file
+    ('cache_size', -65536),     # 64 MB page cache per connection
+    ('temp_store', 'MEMORY'),   # sorts and temp B-trees stay off disk
+    ('synchronous', 'NORMAL'),  # durable enough once the database is in WAL mode
+]
+
+
+def database_generation(path):
+    """Identify the file a database path currently resolves to
+
+    load_data.py --mode snapshot swaps a symlink to point at a freshly built
+    file, so the path alone does not say which data a connection reads.
+    """
+    target = os.path.realpath(path)
+    try:
+        return f'{target}:{os.stat(target).st_ino}'
+    except FileNotFoundError:
+        return f'{target}:new'
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that remembers which database file it was opened on
+
+    Statements run through execute() are timed, with their row counts, by
+    metrics.TimedCursor.
+    """
+    generation = None
+
+    def execute(self, sql, parameters=()):
+        return self.cursor(TimedCursor).execute(sql, parameters)
+
+
+class ConnectionPool:
+    """Keep SQLite connections open between requests and hand them out per thread
+
+    Every acquire() checks whether the database path now points at another
+    file. If it does, idle connections to the old file are closed and busy
+    ones are closed as they come back, while their requests finish on the
+    data they started with.
+    """
+
+    def __init__(self, database=DATABASE, max_idle=16, read_only=False):
+        self.database = database
+        self.max_idle = max_idle
+        self.read_only = read_only
+        self.generation = None
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'returned': 0,
+            'discarded': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'swaps': 0,
+            'drained': 0,
+        }
+
+    def _connect(self):
+        """Open a new connection with the tuned PRAGMAs applied"""
+        # Open the resolved file, so a swap landing mid-connect cannot mislabel it
+        target = os.path.realpath(self.database)
+        # Connections move between request threads, but only ever one thread at a time
+        conn = sqlite3.connect(target, check_same_thread=False, factory=PooledConnection)
+        conn.generation = database_generation(target)
+        conn.row_factory = sqlite3.Row
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.read_only:
+            # Any write through this connection fails instead of taking the write lock
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _check_swap(self):
+        """Follow the database path to a new file, closing idle connections to the old one"""
+        if database_generation(self.database) == self.generation:
+            return
+        with self._lock:
+            # Look again under the lock: a thread that stat'ed the path before
+            # the swap must not put back the old file once another has moved on
+            generation = database_generation(self.database)
+            if generation == self.generation:
+                return
+            if self.generation is not None:
+                self._stats['swaps'] += 1
+            self.generation = generation
+            stale = [conn for conn in self._idle if conn.generation != generation]
+            self._idle = [conn for conn in self._idle if conn.generation == generation]
+            self._stats['drained'] += len(stale)
+        for conn in stale:
+            conn.close()
+
+    def prepare(self, warm=4):
+        """Switch the database to WAL mode and open the first idle connections"""
+        self._check_swap()
+        conn = self._connect()
+        if not self.read_only:
+            conn.execute('PRAGMA journal_mode = WAL')
+        with self._lock:
+            self._stats['created'] += 1
+            self._idle.append(conn)
+        while len(self._idle) < min(warm, self.max_idle):
+            conn = self._connect()
+            with self._lock:
+                self._stats['created'] += 1
+                self._idle.append(conn)
+
+    def acquire(self):
+        """Take an idle connection, or open a new one if none is free"""
+        self._check_swap()
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self._stats['reused'] += 1
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._stats['in_use'] -= 1
+                raise
+            with self._lock:
+                self._stats['created'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """Give a connection back to the pool, closing it if it may be unusable"""
+        try:
+            if not discard and conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        with self._lock:
+            self._stats['in_use'] -= 1
+            if not discard and conn.generation != self.generation:
+                # Opened before a swap; its request is done with the old file
+                self._stats['drained'] += 1
+            elif not discard and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                self._stats['returned'] += 1
+                return
+            else:
+                self._stats['discarded'] += 1
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Return a snapshot of the pool counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        stats['max_idle'] = self.max_idle
+        stats['read_only'] = self.read_only
+        stats['database'] = self.database
+        stats['file'] = os.path.realpath(self.database)
+        return stats
+
+
+pool = ConnectionPool()
+
+
+def migrate_database(database=DATABASE):
+    """Switch the database to WAL mode and bring its schema up to date
+
+    Uses a connection of its own, so read-only pools can still start
+    against a database that needs migrating.
+    """
+    conn = sqlite3.connect(database)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        return migrations.migrate(conn)
+    finally:
+        conn.close()
+
+
+def get_db_connection():
+    """Return the pooled connection for the current request"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def discard_db_connection():
+    """Make sure the current request's connection is closed instead of reused"""
+    g.db_failed = True
+
+
+def close_db_connection(error=None):
+    """Return the request's connection to the pool at the end of the app context"""
+    conn = g.pop('db', None)
+    failed = g.pop('db_failed', False)
+    if conn is not None:
+        pool.release(conn, discard=failed or error is not None)
+
+
+def init_app(app):
+    """Bring the schema up to date and prepare the pool at startup"""
+    migrate_database(pool.database)
+    pool.prepare()
+    app.teardown_appcontext(close_db_connection)
+    atexit.register(pool.close_all)
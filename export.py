@@ -0,0 +1,148 @@
+import csv
+import io
+import zlib
+
+from pagination import SQLITE_INT_MIN, SQLITE_INT_MAX
+from serializers import row_encoder
+from timestamps import parse_timestamp
+
+# Rows pulled from SQLite per fetchmany() call; memory use stays bounded by this
+EXPORT_BATCH_SIZE = 1000
+
+ORDER_EXPORT_COLUMNS = [
+    'order_id', 'user_id', 'status', 'gender', 'created_at', 'shipped_at',
+    'delivered_at', 'returned_at', 'num_of_item',
+]
+
+CUSTOMER_EXPORT_COLUMNS = [
+    'id', 'first_name', 'last_name', 'email', 'age', 'gender',
+    'state', 'city', 'country', 'created_at',
+]
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+class InvalidExportFilter(ValueError):
+    """Raised when an export filter parameter cannot be used"""
+
+
+def parse_date_arg(args, name):
+    """Validate an ISO date or datetime filter and return it as UTC text like the stored timestamps"""
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise InvalidExportFilter(f'{name} must be an ISO date such as 2022-01-31')
+
+
+def add_date_range(args, clauses, params):
+    """Add created_at >= start and created_at < end filters; True if any were added"""
+    start = parse_date_arg(args, 'start')
+    end = parse_date_arg(args, 'end')
+    if start is not None:
+        clauses.append('created_at >= ?')
+        params.append(start)
+    if end is not None:
+        clauses.append('created_at < ?')
+        params.append(end)
+    return start is not None or end is not None
+
+
+def build_query(table, columns, clauses, order_by):
+    """Assemble an export SELECT from its filter clauses"""
+    sql = f'SELECT {", ".join(columns)} FROM {table}'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    return sql + ' ORDER BY ' + order_by
+
+
+def orders_export_query(args):
+    """Build the orders export SQL and parameters from status/start/end/user_id filters
+
+    Rows come back in the order of whichever index serves the filter, so
+    SQLite never has to buffer the result in a temp B-tree to sort it.
+    """
+    clauses, params = [], []
+    order_by = 'order_id'
+
+    status = args.get('status')
+    if status:
+        clauses.append('status = ?')
+        params.append(status)
+
+    if add_date_range(args, clauses, params):
+        order_by = 'created_at, order_id'
+
+    user_id = args.get('user_id')
+    if user_id is not None:
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            raise InvalidExportFilter('user_id must be an integer')
+        if not SQLITE_INT_MIN <= user_id <= SQLITE_INT_MAX:
+            raise InvalidExportFilter('user_id is out of range')
+        params.append(user_id)
+        clauses.append('user_id = ?')
+        # idx_orders_user_created is ordered by created_at; a customer's orders are few
+        order_by = 'created_at'
+
+    return build_query('orders', ORDER_EXPORT_COLUMNS, clauses, order_by), params
+
+
+def customers_export_query(args):
+    """Build the customers export SQL and parameters from state/country/start/end filters"""
+    clauses, params = [], []
+    for column in ('state', 'country'):
+        value = args.get(column)
+        if value:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    add_date_range(args, clauses, params)
+    return build_query('users', CUSTOMER_EXPORT_COLUMNS, clauses, 'id'), params
+
+
+def iter_batches(cursor, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of rows from a cursor without ever holding the full result"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def ndjson_chunks(cursor, columns):
+    """Encode rows as one JSON object per line, a batch per chunk"""
+    # Keys stay in column order, so the encoder only fills in each row's values
+    encode = row_encoder(columns, sort_keys=False).encode
+    for rows in iter_batches(cursor):
+        yield ''.join([encode(row) + '\n' for row in rows]).encode('utf-8')
+
+
+def csv_chunks(cursor, columns):
+    """Encode rows as CSV with a header line, a batch per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in iter_batches(cursor):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # A header-only export still needs its header
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of chunks into one gzip stream as they are produced"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
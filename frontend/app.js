@@ -3,39 +3,34 @@ const API_BASE_URL = 'http://localhost:5000/api';
 let currentPage = 1;
 let currentSearch = '';
 let allCustomers = [];
-let filteredCustomers = [];
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
     loadStatistics();
     loadCustomers();
     setupSearchListener();
-    checkApiStatus();
 });
 
-// Check API connection status
-async function checkApiStatus() {
-    try {
-        const response = await fetch(`${API_BASE_URL}/statistics`);
-        const statusElement = document.getElementById('api-status');
-        if (response.ok) {
-            statusElement.textContent = 'Connected';
-            statusElement.className = 'badge bg-success';
-        } else {
-            statusElement.textContent = 'Error';
-            statusElement.className = 'badge bg-danger';
-        }
-    } catch (error) {
-        const statusElement = document.getElementById('api-status');
-        statusElement.textContent = 'Disconnected';
-        statusElement.className = 'badge bg-danger';
-    }
+// Show API connection status
+function setApiStatus(text, connected) {
+    const statusElement = document.getElementById('api-status');
+    statusElement.textContent = text;
+    statusElement.className = connected ? 'badge bg-success' : 'badge bg-danger';
 }
 
-// Load statistics
+// Load statistics (the same request tells us whether the API is reachable)
 async function loadStatistics() {
+    let response;
+    try {
+        response = await fetch(`${API_BASE_URL}/statistics`);
+    } catch (error) {
+        setApiStatus('Disconnected', false);
+        showError('Failed to load statistics');
+        return;
+    }
+    setApiStatus(response.ok ? 'Connected' : 'Error', response.ok);
+    
     try {
-        const response = await fetch(`${API_BASE_URL}/statistics`);
         const data = await response.json();
         const stats = data.statistics;
         
@@ -83,13 +78,15 @@ async function loadStatistics() {
     }
 }
 
-// Load customers with pagination
+// Load customers with pagination, or search results when there is a search term
 async function loadCustomers(page = 1, search = '') {
     showLoading(true);
     hideError();
     
     try {
-        const url = `${API_BASE_URL}/customers?page=${page}&per_page=12`;
+        const url = search
+            ? `${API_BASE_URL}/customers/search?q=${encodeURIComponent(search)}&page=${page}&per_page=12`
+            : `${API_BASE_URL}/customers?page=${page}&per_page=12`;
         const response = await fetch(url);
         
         if (!response.ok) {
@@ -97,13 +94,7 @@ async function loadCustomers(page = 1, search = '') {
         }
         
         const data = await response.json();
-        allCustomers = data.customers;
-        
-        if (search) {
-            filterCustomers(search);
-        } else {
-            filteredCustomers = allCustomers;
-        }
+        allCustomers = await withOrderCounts(data.customers);
         
         displayCustomers();
         displayPagination(data.pagination);
@@ -115,21 +106,36 @@ async function loadCustomers(page = 1, search = '') {
     }
 }
 
-// Filter customers based on search term
-function filterCustomers(searchTerm) {
-    const term = searchTerm.toLowerCase();
-    filteredCustomers = allCustomers.filter(customer => 
-        customer.first_name.toLowerCase().includes(term) ||
-        customer.last_name.toLowerCase().includes(term) ||
-        customer.email.toLowerCase().includes(term)
-    );
+// Fill in order counts for a page of customers with one batch request
+async function withOrderCounts(customers) {
+    if (customers.length === 0) {
+        return customers;
+    }
+    
+    try {
+        const ids = customers.map(customer => customer.id).join(',');
+        const response = await fetch(`${API_BASE_URL}/customers?ids=${ids}`);
+        if (!response.ok) {
+            return customers;
+        }
+        
+        const data = await response.json();
+        const orderCounts = new Map(data.customers.map(customer => [customer.id, customer.order_count]));
+        return customers.map(customer => ({
+            ...customer,
+            order_count: orderCounts.get(customer.id) || 0
+        }));
+    } catch (error) {
+        // Cards still render, just without order counts
+        return customers;
+    }
 }
 
 // Display customers in cards
 function displayCustomers() {
     const container = document.getElementById('customersContainer');
     
-    if (filteredCustomers.length === 0) {
+    if (allCustomers.length === 0) {
         container.innerHTML = `
             <div class="col-12 text-center">
                 <div class="alert alert-info">
@@ -141,7 +147,7 @@ function displayCustomers() {
         return;
     }
     
-    container.innerHTML = filteredCustomers.map(customer => `
+    container.innerHTML = allCustomers.map(customer => `
         <div class="col-md-6 col-lg-4 mb-4">
             <div class="card customer-card h-100" onclick="showCustomerDetails(${customer.id})">
                 <div class="card-body">
@@ -331,14 +337,10 @@ function setupSearchListener() {
     searchInput.addEventListener('input', function() {
         clearTimeout(searchTimeout);
         searchTimeout = setTimeout(() => {
-            currentSearch = this.value;
-            if (currentSearch) {
-                filterCustomers(currentSearch);
-                displayCustomers();
-            } else {
-                filteredCustomers = allCustomers;
-                displayCustomers();
-            }
+            // Search runs on the server across every customer, not just this page
+            currentSearch = this.value.trim();
+            currentPage = 1;
+            loadCustomers(1, currentSearch);
         }, 300);
     });
 }
@@ -347,8 +349,8 @@ function setupSearchListener() {
 function clearSearch() {
     document.getElementById('searchInput').value = '';
     currentSearch = '';
-    filteredCustomers = allCustomers;
-    displayCustomers();
+    currentPage = 1;
+    loadCustomers(1);
 }
 
 // Utility functions
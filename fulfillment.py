@@ -0,0 +1,160 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import queries
+from cache import get_table_version
+
+# Durations reported, each from one timestamp column to another
+METRICS = {
+    'time_to_ship': ('created_at', 'shipped_at'),
+    'time_to_deliver': ('created_at', 'delivered_at'),
+    'time_to_return': ('delivered_at', 'returned_at'),
+}
+
+TIMESTAMPS = ('created_at', 'shipped_at', 'delivered_at', 'returned_at')
+
+GROUP_BYS = ('status', 'state')
+
+PERCENTILES = (50, 90, 99)
+
+# Histogram bin edges in hours; the last bin is open-ended
+HISTOGRAM_EDGES = np.array([0, 6, 12, 24, 48, 72, 96, 120, 168, 240, 336, 504, 720], dtype=float)
+
+
+def load_columns(conn):
+    """Read every order into NumPy arrays: durations in hours and group labels
+
+    A duration is NaN when either timestamp is missing or it would be
+    negative (bad data rather than a fast shipment).
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = None  # plain tuples build the DataFrame much faster than Rows
+    frame = pd.DataFrame.from_records(
+        cursor.execute(queries.FULFILLMENT_ORDERS).fetchall(),
+        columns=[*GROUP_BYS, *TIMESTAMPS]
+    )
+
+    # Julian days as floats, NaN where a timestamp is missing
+    days = frame[list(TIMESTAMPS)].to_numpy(dtype=float)
+    stamps = dict(zip(TIMESTAMPS, days.T))
+    durations = {}
+    for metric, (start, end) in METRICS.items():
+        hours = (stamps[end] - stamps[start]) * 24
+        hours[hours < 0] = np.nan
+        durations[metric] = hours
+
+    groups = {None: (np.zeros(len(frame), dtype=np.intp), [None])}
+    for group_by in GROUP_BYS:
+        codes, labels = pd.factorize(frame[group_by], use_na_sentinel=True)
+        # Orders without a status/state form their own group, reported as null
+        codes = np.where(codes < 0, len(labels), codes)
+        groups[group_by] = (codes, list(labels) + [None])
+    return len(frame), durations, groups
+
+
+def summarize(values, codes, group_count):
+    """Count, mean, percentiles and histogram of values for every group at once
+
+    One sort by (group, value) lays every group out contiguously, so each
+    percentile is an index calculation across all groups together.
+    """
+    valid = ~np.isnan(values)
+    values, codes = values[valid], codes[valid]
+    order = np.lexsort((values, codes))
+    values, codes = values[order], codes[order]
+
+    counts = np.bincount(codes, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sums = np.bincount(codes, weights=values, minlength=group_count)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+
+    percentiles = {}
+    last = np.maximum(counts - 1, 0)
+    for q in PERCENTILES:
+        # Linear interpolation between the closest ranks, as np.percentile does
+        position = starts + last * (q / 100)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.minimum(lower + 1, starts + last)
+        if len(values):
+            lower_values = values[np.minimum(lower, len(values) - 1)]
+            upper_values = values[np.minimum(upper, len(values) - 1)]
+            result = lower_values + (upper_values - lower_values) * (position - lower)
+        else:
+            result = np.zeros(group_count)
+        percentiles[q] = np.where(counts > 0, result, np.nan)
+
+    bins = np.searchsorted(HISTOGRAM_EDGES, values, side='right') - 1
+    histograms = np.bincount(
+        codes * len(HISTOGRAM_EDGES) + bins, minlength=group_count * len(HISTOGRAM_EDGES)
+    ).reshape(group_count, len(HISTOGRAM_EDGES))
+
+    return counts, means, percentiles, histograms
+
+
+def as_number(value):
+    """A float for JSON, with NaN as null"""
+    return None if np.isnan(value) else round(float(value), 3)
+
+
+class FulfillmentAnalytics:
+    """Fulfillment latency arrays, reloaded only when orders or customers change
+
+    Summaries per group_by are computed on first request after a reload
+    and kept until the next one, so repeat requests only build JSON.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._columns = None
+        self._summaries = {}
+        self.loads = 0
+        self.last_load_seconds = None
+
+    def _current(self, conn):
+        """Arrays and summary memo for the data the connection sees, reloading if stale"""
+        version = (getattr(conn, 'generation', None),
+                   get_table_version(conn, 'orders'), get_table_version(conn, 'users'))
+        with self._lock:
+            if version != self._version:
+                started = time.perf_counter()
+                self._columns = load_columns(conn)
+                self._summaries = {}
+                self._version = version
+                self.loads += 1
+                self.last_load_seconds = time.perf_counter() - started
+            return self._columns, self._summaries
+
+    def report(self, conn, group_by=None):
+        """Latency percentiles and histograms, overall or per status or state"""
+        (order_count, durations, groups), summaries = self._current(conn)
+        if group_by not in summaries:
+            codes, labels = groups[group_by]
+            groups_out = [{'key': label, 'orders': 0} for label in labels]
+            for count, label in zip(np.bincount(codes, minlength=len(labels)), groups_out):
+                label['orders'] = int(count)
+            for metric, values in durations.items():
+                counts, means, percentiles, histograms = summarize(values, codes, len(labels))
+                for i, group in enumerate(groups_out):
+                    group[metric] = {
+                        'count': int(counts[i]),
+                        'mean': as_number(means[i]),
+                        **{f'p{q}': as_number(percentiles[q][i]) for q in PERCENTILES},
+                        'histogram': histograms[i].tolist(),
+                    }
+            # Groups with no orders at all (an unused null group) are left out
+            summaries[group_by] = [group for group in groups_out if group['orders']]
+        return {
+            'orders': order_count,
+            'unit': 'hours',
+            'histogram_edges': HISTOGRAM_EDGES.tolist(),
+            'groups': summaries[group_by],
+        }
+
+    def stats(self):
+        """Reload counters"""
+        return {'loads': self.loads, 'last_load_seconds': self.last_load_seconds}
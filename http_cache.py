@@ -0,0 +1,99 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import request, make_response
+
+from db import get_db_connection
+
+# Bump when a response format changes, so clients drop bodies cached by older code
+ETAG_VERSION = '1'
+
+
+def get_table_markers(conn, tables):
+    """Return (version, updated_at) for each table, in the order given"""
+    placeholders = ','.join('?' for _ in tables)
+    rows = conn.execute(
+        f'SELECT table_name, version, updated_at FROM table_versions WHERE table_name IN ({placeholders})',
+        tables
+    ).fetchall()
+    markers = {row[0]: (row[1], row[2]) for row in rows}
+    return [markers.get(table, (0, None)) for table in tables]
+
+
+def etag_for(path, query_items, markers, generation=None):
+    """Hash the data version markers together with a path and its query parameters
+
+    generation names the database file, since a freshly swapped-in
+    snapshot can start its change counters at the same values. The
+    ASGI server calls this directly, so both servers agree on ETags.
+    """
+    args = urlencode(sorted(query_items))
+    raw = f'{ETAG_VERSION}|{generation}|{path}?{args}|{markers}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def compute_etag(markers, generation=None):
+    """ETag of the current request for the given data version markers"""
+    return etag_for(request.path, request.args.items(multi=True), markers, generation)
+
+
+def last_modified_of(markers):
+    """Latest change time across the tables, or None if unknown"""
+    stamps = [updated_at for _, updated_at in markers if updated_at]
+    if not stamps:
+        return None
+    # CURRENT_TIMESTAMP is UTC in "YYYY-MM-DD HH:MM:SS" form, so the strings sort correctly
+    return datetime.strptime(max(stamps), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def is_not_modified(etag, last_modified):
+    """Check the request's validators, preferring If-None-Match as HTTP requires"""
+    if request.if_none_match:
+        # Weak comparison, as HTTP specifies for If-None-Match: a client holding
+        # the compressed body has the weak W/ form of the ETag
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def cached_endpoint(tables, max_age=0, private=True):
+    """Answer repeat GETs with 304 until one of the tables changes
+
+    The ETag comes from the tables' change counters, so a client that
+    already holds the current body gets a 304 without the endpoint's
+    query or JSON serialization running. tables may also be a function
+    returning the tables, for endpoints whose reads depend on parameters.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            read_tables = tables() if callable(tables) else tables
+            conn = get_db_connection()
+            markers = get_table_markers(conn, read_tables)
+            etag = compute_etag(markers, conn.generation)
+            last_modified = last_modified_of(markers)
+
+            if is_not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.max_age = max_age
+            if private:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            if max_age == 0:
+                # Always revalidate; the 304 path is cheap
+                response.cache_control.must_revalidate = True
+            return response
+        return wrapper
+    return decorator
@@ -1,23 +1,439 @@
+import argparse
+import csv
+import io
+import os
+import re
 import sqlite3
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 import pandas as pd
+from migrations import migrate, rebuild_derived
 
-# Connect to database
-conn = sqlite3.connect('ecommerce.db')
+# Rows parsed and inserted per step; memory use is bounded by this, not by the CSV size
+CHUNK_SIZE = 50000
 
-# Clear existing data to avoid duplicate primary key error
-cursor = conn.cursor()
-cursor.execute("DELETE FROM users")
-cursor.execute("DELETE FROM orders")
-conn.commit()
+# Bytes of CSV a worker parses per task when loading with --workers
+SHARD_BYTES = 8 * 1024 * 1024
 
-# Load users.csv
-users_df = pd.read_csv('users.csv')
-users_df.to_sql('users', conn, if_exists='append', index=False)
-print("Users data loaded successfully.")
+# Snapshot files kept next to the database, the live one included
+SNAPSHOTS_KEPT = 2
 
-# Load orders.csv
-orders_df = pd.read_csv('orders.csv')
-orders_df.to_sql('orders', conn, if_exists='append', index=False)
-print("Orders data loaded successfully.")
+# change_log rows kept after a delta load; API caches further behind than this start over
+CHANGE_LOG_KEEP = 100000
 
-conn.close()
+# Explicit dtypes: no type inference per chunk, and postal codes keep their leading zeros
+USERS_DTYPES = {
+    'id': 'Int64',
+    'first_name': 'string',
+    'last_name': 'string',
+    'email': 'string',
+    'age': 'Int64',
+    'gender': 'string',
+    'state': 'string',
+    'street_address': 'string',
+    'postal_code': 'string',
+    'city': 'string',
+    'country': 'string',
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'traffic_source': 'string',
+    'created_at': 'string',
+}
+
+ORDERS_DTYPES = {
+    'order_id': 'Int64',
+    'user_id': 'Int64',
+    'status': 'string',
+    'gender': 'string',
+    'created_at': 'string',
+    'returned_at': 'string',
+    'shipped_at': 'string',
+    'delivered_at': 'string',
+    'num_of_item': 'Int64',
+}
+
+# Primary key, and the timestamps a new or changed row moves past the high-water mark
+DELTA_TABLES = {
+    'users': ('id', ['created_at']),
+    'orders': ('order_id', ['created_at', 'shipped_at', 'delivered_at', 'returned_at']),
+}
+
+
+# One parsed piece of a CSV: rows ready for executemany(), how many CSV
+# rows it came from, and (delta loads) the newest timestamp among them
+ParsedChunk = namedtuple('ParsedChunk', 'columns rows scanned latest')
+
+
+def chunk_rows(chunk):
+    """Convert a DataFrame to tuples of plain Python values, with missing values as None"""
+    values = chunk.astype(object).where(chunk.notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+
+def delta_chunk(chunk, stamps, high_water):
+    """Rows of a chunk that are newer than high_water, and the chunk's newest timestamp
+
+    Rows without any timestamp cannot be placed, so they are always kept;
+    the upsert turns them into no-ops when nothing changed.
+    """
+    present = [column for column in stamps if column in chunk.columns]
+    if high_water is None or not present:
+        newer = pd.Series(True, index=chunk.index)
+    else:
+        newer = chunk[present].isna().all(axis=1)
+        for column in present:
+            newer |= (chunk[column] > high_water).fillna(False)
+    latest = [chunk[column].max() for column in present]
+    latest = [value for value in latest if not pd.isna(value)]
+    return chunk[newer], max(latest, default=None)
+
+
+def parse_chunk(chunk, delta=None):
+    """Turn a DataFrame into a ParsedChunk, keeping only delta candidates if delta is given
+
+    delta is (timestamp columns, high-water mark), see delta_chunk().
+    """
+    scanned = len(chunk)
+    latest = None
+    if delta is not None:
+        chunk, latest = delta_chunk(chunk, *delta)
+    return ParsedChunk(list(chunk.columns), chunk_rows(chunk), scanned, latest)
+
+
+def read_chunks(path, dtypes, chunk_size=CHUNK_SIZE, delta=None):
+    """Parse a CSV in one process, chunk_size rows at a time"""
+    for chunk in pd.read_csv(path, dtype=dtypes, chunksize=chunk_size):
+        yield parse_chunk(chunk, delta)
+
+
+def shard_ranges(path, shard_bytes=SHARD_BYTES, min_shards=1):
+    """Return a CSV's header columns and byte ranges of its data that start on a new line
+
+    Quoted fields containing newlines would be cut in two; the exports in
+    this project never contain them.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        shard_count = max(min_shards, -(-(size - start) // shard_bytes))
+        step = max((size - start) // shard_count, 1)
+        bounds = [start]
+        for offset in range(start + step, size, step):
+            f.seek(offset)
+            f.readline()  # finish the line the offset fell into
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+        bounds.append(size)
+    columns = next(csv.reader([header.decode('utf-8-sig')]))
+    return columns, [(lo, hi) for lo, hi in zip(bounds, bounds[1:]) if hi > lo]
+
+
+def parse_shard(path, start, end, columns, dtypes, delta=None):
+    """Worker process: parse and type one byte range of a CSV"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    chunk = pd.read_csv(io.BytesIO(data), names=columns, header=None, dtype=dtypes)
+    return parse_chunk(chunk, delta)
+
+
+def read_chunks_parallel(path, dtypes, workers, delta=None):
+    """Parse a CSV in worker processes, yielding shards in file order
+
+    Only a few shards per worker are in flight at once, so a writer that
+    falls behind does not pile parsed rows up in memory.
+    """
+    columns, ranges = shard_ranges(path, min_shards=workers * 4)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(parse_shard, path, start, end, columns, dtypes, delta))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_chunks(path, dtypes, chunk_size=CHUNK_SIZE, workers=1, delta=None):
+    """Parse a CSV with pandas in this process, or in workers processes when workers > 1"""
+    if workers > 1:
+        return read_chunks_parallel(path, dtypes, workers, delta)
+    return read_chunks(path, dtypes, chunk_size, delta)
+
+
+def insert_chunks(conn, table, chunks):
+    """executemany() every chunk into a table; returns the number of rows inserted"""
+    total = 0
+    for chunk in chunks:
+        placeholders = ', '.join('?' for _ in chunk.columns)
+        conn.executemany(
+            f'INSERT INTO {table} ({", ".join(chunk.columns)}) VALUES ({placeholders})',
+            chunk.rows
+        )
+        total += len(chunk.rows)
+    return total
+
+
+def drop_indexes_and_triggers(conn, tables):
+    """Drop the secondary indexes and triggers on tables; returns their SQL for later"""
+    placeholders = ', '.join('?' for _ in tables)
+    objects = conn.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND tbl_name IN ({placeholders})
+          AND sql IS NOT NULL
+    ''', tables).fetchall()
+    for object_type, name, _ in objects:
+        conn.execute(f'DROP {object_type.upper()} IF EXISTS {name}')
+    return [sql for _, _, sql in objects]
+
+
+def get_high_water(conn, table):
+    """Return the newest timestamp already loaded into a table, or None"""
+    row = conn.execute('SELECT high_water FROM load_state WHERE table_name = ?', (table,)).fetchone()
+    return row[0] if row else None
+
+
+def set_high_water(conn, table, high_water):
+    """Record the newest timestamp loaded into a table"""
+    conn.execute('''
+        INSERT INTO load_state (table_name, high_water, loaded_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (table_name) DO UPDATE SET
+            high_water = excluded.high_water, loaded_at = excluded.loaded_at
+    ''', (table, high_water))
+
+
+def latest_timestamp(conn, table):
+    """Newest value of any of a table's delta timestamps"""
+    _, stamps = DELTA_TABLES[table]
+    parts = ' UNION ALL '.join(f'SELECT MAX({column}) AS stamp FROM {table}' for column in stamps)
+    return conn.execute(f'SELECT MAX(stamp) FROM ({parts})').fetchone()[0]
+
+
+def upsert_sql(table, key, columns):
+    """INSERT that updates an existing row, but only when a value actually differs
+
+    Skipping unchanged rows keeps the triggers quiet for them, so change
+    counters, statistics and the API caches only move for real changes.
+    """
+    placeholders = ', '.join('?' for _ in columns)
+    updated = [column for column in columns if column != key]
+    assignments = ', '.join(f'{column} = excluded.{column}' for column in updated)
+    differs = ' OR '.join(f'{table}.{column} IS NOT excluded.{column}' for column in updated)
+    return f'''
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})
+        ON CONFLICT ({key}) DO UPDATE SET {assignments}
+        WHERE {differs}
+    '''
+
+
+def delta_load(conn, users_csv='users.csv', orders_csv='orders.csv', chunk_size=CHUNK_SIZE,
+               since=None, workers=1):
+    """Upsert rows that are new or changed since the last load, while the API keeps serving
+
+    Candidates are rows with a timestamp past the table's high-water mark
+    (or since, when given). Each chunk commits on its own, so in WAL mode
+    readers are never blocked for long and never see a half-applied chunk.
+    The triggers keep the statistics, search index and caches current.
+    The high-water mark only advances once a whole file has been applied,
+    so an interrupted load is simply rerun.
+    """
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+
+    for table, path, dtypes in (('users', users_csv, USERS_DTYPES),
+                                ('orders', orders_csv, ORDERS_DTYPES)):
+        key, stamps = DELTA_TABLES[table]
+        high_water = since if since is not None else get_high_water(conn, table)
+        newest = high_water
+        scanned = candidates = written = 0
+        started = time.perf_counter()
+
+        for chunk in iter_chunks(path, dtypes, chunk_size, workers, (stamps, high_water)):
+            scanned += chunk.scanned
+            if chunk.latest is not None and (newest is None or chunk.latest > newest):
+                newest = chunk.latest
+            if not chunk.rows:
+                continue
+            candidates += len(chunk.rows)
+            conn.execute('BEGIN')
+            try:
+                cursor = conn.executemany(upsert_sql(table, key, chunk.columns), chunk.rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            written += cursor.rowcount
+
+        set_high_water(conn, table, newest)
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        print(f"{table.capitalize()} delta applied: {scanned:,} rows scanned, {candidates:,} candidates, "
+              f"{written:,} inserted or updated in {elapsed:.2f}s (high-water mark {newest})")
+
+    # Readers that fell further behind than this just clear their caches
+    conn.execute(
+        'DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?',
+        (CHANGE_LOG_KEEP,)
+    )
+    conn.commit()
+
+
+def bulk_load(conn, users_csv='users.csv', orders_csv='orders.csv', chunk_size=CHUNK_SIZE, workers=1):
+    """Replace users and orders with the CSV contents, as fast as SQLite allows
+
+    Journaling and fsync are switched off, and indexes and triggers are
+    dropped for the length of the load. That makes the load unsafe to
+    interrupt: rerun it if it fails. Derived tables (statistics, search
+    index, change counters) are rebuilt in one pass at the end.
+    """
+    # Leaving WAL needs every other connection closed; if the API still has
+    # the database open the load continues in WAL mode instead
+    journal_mode = conn.execute('PRAGMA journal_mode = OFF').fetchone()[0]
+    conn.execute('PRAGMA synchronous = OFF')
+    print(f"Journal mode during load: {journal_mode}")
+
+    saved_sql = drop_indexes_and_triggers(conn, ('users', 'orders'))
+    conn.commit()
+
+    conn.execute('BEGIN')
+    try:
+        # Clear existing data to avoid duplicate primary key errors
+        conn.execute('DELETE FROM users')
+        conn.execute('DELETE FROM orders')
+
+        for table, path, dtypes in (('users', users_csv, USERS_DTYPES),
+                                    ('orders', orders_csv, ORDERS_DTYPES)):
+            started = time.perf_counter()
+            rows = insert_chunks(conn, table, iter_chunks(path, dtypes, chunk_size, workers))
+            elapsed = time.perf_counter() - started
+            print(f"{table.capitalize()} data loaded successfully: "
+                  f"{rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec)")
+
+        started = time.perf_counter()
+        for sql in saved_sql:
+            conn.execute(sql)
+        rebuild_derived(conn)
+        for table in DELTA_TABLES:
+            set_high_water(conn, table, latest_timestamp(conn, table))
+        conn.commit()
+        print(f"Indexes, triggers and derived tables rebuilt in {time.perf_counter() - started:.2f}s")
+    except Exception:
+        conn.rollback()
+        # Put the schema back even though the data did not load
+        for sql in saved_sql:
+            conn.execute(sql.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1)
+                            .replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS', 1))
+        conn.commit()
+        raise
+    finally:
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+
+    conn.execute('ANALYZE')
+    # change_log holds one row right after a full load but grows with every
+    # delta; stats saying "1 row" would make the planner scan it instead of
+    # seeking by seq, so leave it to the default estimates
+    conn.execute("DELETE FROM sqlite_stat1 WHERE tbl = 'change_log'")
+    conn.commit()
+
+
+def snapshot_files(database):
+    """Snapshot files built for a database path, oldest first"""
+    directory = os.path.dirname(os.path.abspath(database))
+    base, ext = os.path.splitext(os.path.basename(database))
+    pattern = re.compile(rf'^{re.escape(base)}-\d{{8}}-\d{{6}}-\d{{6}}{re.escape(ext)}$')
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if pattern.match(name))
+
+
+def swap_database(database, target):
+    """Point the database path at target with a single atomic rename
+
+    The path becomes a symlink; connections already open keep reading the
+    file they opened, and the API's pool moves new requests to target.
+    """
+    link = database + '.swap'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)
+    os.replace(link, database)
+
+
+def prune_snapshots(database, keep=SNAPSHOTS_KEPT):
+    """Delete all but the newest keep snapshots, never the live one"""
+    live = os.path.realpath(database)
+    old = [path for path in snapshot_files(database) if path != live]
+    for path in old[:max(len(old) - (keep - 1), 0)]:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        print(f"Removed old snapshot {os.path.basename(path)}")
+    # Left behind by the plain file the first swap replaced; SQLite follows
+    # the symlink and keeps the live WAL next to the snapshot instead
+    for suffix in ('-wal', '-shm'):
+        if os.path.islink(database) and os.path.exists(database + suffix):
+            os.remove(database + suffix)
+
+
+def snapshot_load(database, users_csv='users.csv', orders_csv='orders.csv', chunk_size=CHUNK_SIZE,
+                  workers=1, keep=SNAPSHOTS_KEPT):
+    """Build a complete new database beside the live one, then switch to it
+
+    The new file gets the full schema, data, indexes, derived tables and
+    ANALYZE statistics before anything reads it, so the API serves the old
+    data right up to the swap and never waits on the load.
+    """
+    base, ext = os.path.splitext(database)
+    target = f'{base}-{datetime.now():%Y%m%d-%H%M%S-%f}{ext}'
+
+    conn = sqlite3.connect(target)
+    try:
+        migrate(conn)
+        bulk_load(conn, users_csv, orders_csv, chunk_size, workers)
+        # Fold the WAL back in so the snapshot is one self-contained file
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    except Exception:
+        conn.close()
+        os.remove(target)
+        raise
+    conn.close()
+
+    swap_database(database, target)
+    print(f"{database} now points at {os.path.basename(target)}")
+    prune_snapshots(database, keep)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load users.csv and orders.csv into ecommerce.db')
+    parser.add_argument('--db', default='ecommerce.db', help='SQLite database to load into')
+    parser.add_argument('--users', default='users.csv', help='users CSV file')
+    parser.add_argument('--orders', default='orders.csv', help='orders CSV file')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='CSV rows parsed and inserted per step')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes parsing the CSVs; rows are still written by this one')
+    parser.add_argument('--mode', choices=('full', 'delta', 'snapshot'), default='full',
+                        help='full replaces all data (API stopped); delta upserts new and changed rows; '
+                             'snapshot builds a new database file and switches to it')
+    parser.add_argument('--since', help='delta mode: consider rows newer than this timestamp '
+                                        'instead of the stored high-water mark')
+    parser.add_argument('--keep', type=int, default=SNAPSHOTS_KEPT,
+                        help='snapshot mode: snapshot files to keep, the live one included')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.mode == 'snapshot':
+        snapshot_load(args.db, args.users, args.orders, args.chunk_size, args.workers, args.keep)
+    else:
+        # Connect to database, bringing the schema up to date first
+        conn = sqlite3.connect(args.db, timeout=30)
+        migrate(conn)
+        if args.mode == 'delta':
+            delta_load(conn, args.users, args.orders, args.chunk_size, args.since, args.workers)
+        else:
+            bulk_load(conn, args.users, args.orders, args.chunk_size, args.workers)
+        conn.close()
+    print(f"Load finished in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+import queries
+
+logger = logging.getLogger('api.metrics')
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Queries running longer than this are logged with their plan
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_MS', 100)) / 1000
+
+# Named statements from queries.py show up under their name instead of a hash of their SQL
+QUERY_NAMES = {
+    ' '.join(value.split()): name
+    for name, value in vars(queries).items()
+    if name.isupper() and isinstance(value, str)
+}
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count, as Prometheus histograms report them"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(le label, observations at or below it) for every bucket and +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), total
+
+
+def label_value(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{label_value(value)}"' for name, value in labels) + '}'
+
+
+class Metrics:
+    """Request and query timings for one process, rendered for Prometheus
+
+    Requests are keyed by endpoint, method and status; queries by their
+    name in queries.py, or a hash of the SQL for the statements built per
+    request (api_query_info maps those back to their text).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._queries = {}
+        self._errors = {}
+        self._labels = {}
+        self._plans = {}
+
+    def query_label(self, sql):
+        """A stable, short label for a statement"""
+        label = self._labels.get(sql)
+        if label is None:
+            text = ' '.join(sql.split())
+            label = QUERY_NAMES.get(text)
+            if label is None:
+                label = 'sql_' + hashlib.sha1(text.encode('utf-8')).hexdigest()[:10]
+            self._labels[sql] = label
+        return label
+
+    def observe_request(self, endpoint, method, status, seconds):
+        key = (endpoint or 'unmatched', method, str(status))
+        with self._lock:
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_query(self, sql, seconds, rows):
+        """Record one statement's execution time and the rows it returned"""
+        with self._lock:
+            label = self.query_label(sql)
+            stats = self._queries.get(label)
+            if stats is None:
+                stats = self._queries[label] = {'histogram': Histogram(), 'rows': 0, 'slow': 0, 'sql': sql}
+            stats['histogram'].observe(seconds)
+            stats['rows'] += rows
+            if seconds >= SLOW_QUERY_SECONDS:
+                stats['slow'] += 1
+        return label
+
+    def count_error(self, endpoint):
+        with self._lock:
+            self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def slow_query(self, conn, sql, params, seconds, rows):
+        """Log a slow statement with its query plan, looked up once per statement"""
+        with self._lock:
+            label = self.query_label(sql)
+        plan = self._plans.get(sql)
+        if plan is None:
+            try:
+                plan = [row[3] for row in sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params)]
+            except sqlite3.Error as e:
+                plan = [f'(plan unavailable: {e})']
+            self._plans[sql] = plan
+        logger.warning(
+            'Slow query %s: %.1f ms, %d rows\n%s\nParameters: %r\nPlan:\n%s',
+            label, seconds * 1000, rows, ' '.join(sql.split()), params,
+            '\n'.join(f'  {step}' for step in plan)
+        )
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP api_request_duration_seconds Time from request to response, by endpoint',
+                '# TYPE api_request_duration_seconds histogram',
+            ]
+            for (endpoint, method, status), histogram in sorted(self._requests.items()):
+                labels = [('endpoint', endpoint), ('method', method), ('status', status)]
+                lines += self._histogram_lines('api_request_duration_seconds', labels, histogram)
+
+            lines += [
+                '# HELP api_query_duration_seconds Time spent executing and fetching a statement',
+                '# TYPE api_query_duration_seconds histogram',
+            ]
+            for label, stats in sorted(self._queries.items()):
+                lines += self._histogram_lines('api_query_duration_seconds', [('query', label)], stats['histogram'])
+
+            lines += ['# HELP api_query_rows_total Rows returned by a statement', '# TYPE api_query_rows_total counter']
+            lines += [f'api_query_rows_total{format_labels([("query", label)])} {stats["rows"]}'
+                      for label, stats in sorted(self._queries.items())]
+
+            lines += [f'# HELP api_slow_queries_total Statements slower than {SLOW_QUERY_SECONDS:g}s',
+                      '# TYPE api_slow_queries_total counter']
+            lines += [f'api_slow_queries_total{format_labels([("query", label)])} {stats["slow"]}'
+                      for label, stats in sorted(self._queries.items())]
+
+            lines += ['# HELP api_query_info The SQL behind each query label', '# TYPE api_query_info gauge']
+            lines += [f'api_query_info{format_labels([("query", label), ("sql", " ".join(stats["sql"].split()))])} 1'
+                      for label, stats in sorted(self._queries.items())]
+
+            lines += ['# HELP api_errors_total Requests answered with an internal server error',
+                      '# TYPE api_errors_total counter']
+            lines += [f'api_errors_total{format_labels([("endpoint", endpoint)])} {count}'
+                      for endpoint, count in sorted(self._errors.items())]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram_lines(name, labels, histogram):
+        lines = [f'{name}_bucket{format_labels(labels + [("le", le)])} {count}'
+                 for le, count in histogram.cumulative()]
+        lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum!r}')
+        lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return lines
+
+
+# One registry per process; every connection and both servers report to it
+registry = Metrics()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's time and rows to the registry
+
+    SQLite does its work as rows are stepped through, so the time spent in
+    fetch calls counts along with execute(). A statement is recorded as
+    its results are fetched, and once more time than the slow threshold
+    has gone into it, logged with its plan.
+    """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._sql, self._parameters = sql, parameters
+        self._elapsed = time.perf_counter() - started
+        self._rows = 0
+        self._recorded = self._logged = False
+        if self.description is None:
+            # Not a query; there is nothing to fetch
+            self._record(final=True)
+        return self
+
+    def _fetched(self, started, rows, final):
+        self._elapsed += time.perf_counter() - started
+        self._rows += rows
+        self._record(final)
+
+    def _record(self, final):
+        if self._sql is None:
+            return
+        if self._elapsed >= SLOW_QUERY_SECONDS and not self._logged:
+            self._logged = True
+            registry.slow_query(self.connection, self._sql, self._parameters, self._elapsed, self._rows)
+        if final and not self._recorded:
+            self._recorded = True
+            registry.observe_query(self._sql, self._elapsed, self._rows)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, final=True)
+            raise
+        self._fetched(started, 1, final=False)
+        return row
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        # A lookup reads one row and stops, so the first row completes it too
+        self._fetched(started, row is not None, final=True)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), final=not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), final=True)
+        return rows
+
+
+def init_app(app):
+    """Time every request, and serve the registry on /metrics"""
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            registry.observe_request(request.endpoint, request.method, response.status_code,
+                                     time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """Prometheus scrape endpoint"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
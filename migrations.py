@@ -0,0 +1,610 @@
+import sqlite3
+
+
+def _version_triggers(table):
+    """Triggers that bump a table's change counter on every write"""
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+        AFTER {event} ON {table}
+        BEGIN
+            UPDATE table_versions
+            SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE table_name = '{table}';
+        END
+        '''
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+def _change_log_triggers(table, entities):
+    """Triggers that append the entities a write touches to change_log
+
+    entities is a list of (entity, id expression) with {row} standing for
+    NEW or OLD; an update logs both, with duplicates removed by UNION.
+    """
+    rows = {'INSERT': ['NEW'], 'UPDATE': ['OLD', 'NEW'], 'DELETE': ['OLD']}
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_change_log_{event.lower()}
+        AFTER {event} ON {table}
+        BEGIN
+            INSERT INTO change_log (entity, entity_id)
+            {' UNION '.join(f'SELECT {entity}, {expression.format(row=row)}'
+                            for row in rows[event] for entity, expression in entities)};
+        END
+        '''
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+# Trigger bodies that apply one order row to the materialized statistics.
+# "x IS 'delivered'" rather than "=" so a NULL status counts as 0, not NULL.
+_ORDER_COUNTERS_ADD = '''
+            UPDATE order_stats SET
+                unique_customers = unique_customers + COALESCE(
+                    (SELECT order_count = 1 FROM user_order_summary WHERE user_id = NEW.user_id), 0),
+                total_orders = total_orders + 1,
+                items_total = items_total + COALESCE(NEW.num_of_item, 0),
+                items_counted = items_counted + (NEW.num_of_item IS NOT NULL),
+                delivered_orders = delivered_orders + (NEW.status IS 'delivered'),
+                returned_orders = returned_orders + (NEW.status IS 'returned'),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1;
+'''
+
+_ORDER_COUNTERS_REMOVE = '''
+            UPDATE order_stats SET
+                unique_customers = unique_customers - COALESCE(
+                    (SELECT order_count = 1 FROM user_order_summary WHERE user_id = OLD.user_id), 0),
+                total_orders = total_orders - 1,
+                items_total = items_total - COALESCE(OLD.num_of_item, 0),
+                items_counted = items_counted - (OLD.num_of_item IS NOT NULL),
+                delivered_orders = delivered_orders - (OLD.status IS 'delivered'),
+                returned_orders = returned_orders - (OLD.status IS 'returned'),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1;
+'''
+
+# Migration 4's triggers: a summary row only while the customer has orders
+_ORDER_STATS_ADD = '''
+            INSERT INTO user_order_summary (user_id, order_count)
+            SELECT NEW.user_id, 1 WHERE NEW.user_id IS NOT NULL
+            ON CONFLICT (user_id) DO UPDATE SET order_count = order_count + 1;
+''' + _ORDER_COUNTERS_ADD
+
+_ORDER_STATS_REMOVE = _ORDER_COUNTERS_REMOVE + '''
+            UPDATE user_order_summary SET order_count = order_count - 1 WHERE user_id = OLD.user_id;
+            DELETE FROM user_order_summary WHERE user_id = OLD.user_id AND order_count <= 0;
+'''
+
+# Migration 8's triggers: every customer keeps a row, with order totals and
+# first/last order dates. scalar min()/max() return NULL if either side is,
+# hence the COALESCE; a removed order only re-reads the customer's dates
+# (one idx_orders_user_created seek) when it was the first or last.
+_ORDER_SUMMARY_ADD = '''
+            INSERT INTO user_order_summary
+                (user_id, order_count, total_items, return_count, first_order_at, last_order_at)
+            SELECT NEW.user_id, 1, COALESCE(NEW.num_of_item, 0), NEW.status IS 'returned',
+                   NEW.created_at, NEW.created_at
+            WHERE NEW.user_id IS NOT NULL
+            ON CONFLICT (user_id) DO UPDATE SET
+                order_count = order_count + 1,
+                total_items = total_items + excluded.total_items,
+                return_count = return_count + excluded.return_count,
+                first_order_at = COALESCE(min(first_order_at, excluded.first_order_at),
+                                          first_order_at, excluded.first_order_at),
+                last_order_at = COALESCE(max(last_order_at, excluded.last_order_at),
+                                         last_order_at, excluded.last_order_at);
+''' + _ORDER_COUNTERS_ADD
+
+_ORDER_SUMMARY_REMOVE = _ORDER_COUNTERS_REMOVE + '''
+            UPDATE user_order_summary SET
+                order_count = order_count - 1,
+                total_items = total_items - COALESCE(OLD.num_of_item, 0),
+                return_count = return_count - (OLD.status IS 'returned'),
+                first_order_at = CASE WHEN OLD.created_at IS first_order_at
+                    THEN (SELECT MIN(created_at) FROM orders WHERE user_id = OLD.user_id)
+                    ELSE first_order_at END,
+                last_order_at = CASE WHEN OLD.created_at IS last_order_at
+                    THEN (SELECT MAX(created_at) FROM orders WHERE user_id = OLD.user_id)
+                    ELSE last_order_at END
+            WHERE user_id = OLD.user_id;
+            DELETE FROM user_order_summary
+            WHERE user_id = OLD.user_id AND order_count <= 0
+              AND NOT EXISTS (SELECT 1 FROM users WHERE id = OLD.user_id);
+'''
+
+# Refills user_order_summary (migration 8 and rebuild_derived): order totals
+# per user_id seen in orders, then an empty row for every other customer
+_SUMMARY_BACKFILL = [
+    '''
+        INSERT INTO user_order_summary
+            (user_id, order_count, total_items, return_count, first_order_at, last_order_at)
+        SELECT user_id, COUNT(*), COALESCE(SUM(num_of_item), 0),
+               COUNT(CASE WHEN status = 'returned' THEN 1 END), MIN(created_at), MAX(created_at)
+        FROM orders
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    ''',
+    '''
+        INSERT INTO user_order_summary (user_id)
+        SELECT id FROM users WHERE true
+        ON CONFLICT (user_id) DO NOTHING
+    ''',
+]
+
+_ROLLUP_COLUMNS = 'day, status, gender, country, orders, items, shipped, delivered, returned'
+
+_ROLLUP_MERGE = '''
+            ON CONFLICT (day, status, gender, country) DO UPDATE SET
+                orders = orders + excluded.orders,
+                items = items + excluded.items,
+                shipped = shipped + excluded.shipped,
+                delivered = delivered + excluded.delivered,
+                returned = returned + excluded.returned'''
+
+# Rebuilds order_daily_rollup from scratch (migration 7 and rebuild_derived)
+_ROLLUP_BACKFILL = f'''
+        INSERT INTO order_daily_rollup ({_ROLLUP_COLUMNS})
+        SELECT date(o.created_at), COALESCE(o.status, ''), COALESCE(o.gender, ''),
+               COALESCE(u.country, ''), COUNT(*), COALESCE(SUM(o.num_of_item), 0),
+               COUNT(o.shipped_at), COUNT(o.delivered_at), COUNT(o.returned_at)
+        FROM orders o
+        LEFT JOIN users u ON u.id = o.user_id
+        WHERE date(o.created_at) IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+'''
+
+
+def _rollup_order(row, sign):
+    """Trigger statements adding (sign '+') or removing (sign '-') one order in the rollup"""
+    bucket = f'''date({row}.created_at), COALESCE({row}.status, ''), COALESCE({row}.gender, ''),
+                   COALESCE((SELECT country FROM users WHERE id = {row}.user_id), '')'''
+    statements = [f'''
+            INSERT INTO order_daily_rollup ({_ROLLUP_COLUMNS})
+            SELECT {bucket},
+                   {sign}1, {sign}COALESCE({row}.num_of_item, 0), {sign}({row}.shipped_at IS NOT NULL),
+                   {sign}({row}.delivered_at IS NOT NULL), {sign}({row}.returned_at IS NOT NULL)
+            WHERE date({row}.created_at) IS NOT NULL{_ROLLUP_MERGE};''']
+    if sign == '-':
+        statements.append(f'''
+            DELETE FROM order_daily_rollup
+            WHERE (day, status, gender, country) = (SELECT {bucket}) AND orders <= 0;''')
+    return ''.join(statements)
+
+
+def _rollup_move_customer(user_id, from_country, to_country):
+    """Trigger statements moving a customer's orders between country buckets"""
+    return ''.join(
+        f'''
+            INSERT INTO order_daily_rollup ({_ROLLUP_COLUMNS})
+            SELECT date(created_at), COALESCE(status, ''), COALESCE(gender, ''), COALESCE({country}, ''),
+                   {sign}COUNT(*), {sign}COALESCE(SUM(num_of_item), 0), {sign}COUNT(shipped_at),
+                   {sign}COUNT(delivered_at), {sign}COUNT(returned_at)
+            FROM orders
+            WHERE user_id = {user_id} AND date(created_at) IS NOT NULL
+              AND COALESCE({from_country}, '') IS NOT COALESCE({to_country}, '')
+            GROUP BY 1, 2, 3{_ROLLUP_MERGE};'''
+        for sign, country in (('-', from_country), ('', to_country))
+    ) + f'''
+            DELETE FROM order_daily_rollup
+            WHERE country = COALESCE({from_country}, '') AND orders <= 0
+              AND day IN (SELECT date(created_at) FROM orders WHERE user_id = {user_id});'''
+
+
+# Each migration is (version, description, statements). The database's
+# PRAGMA user_version records the last version applied, so running
+# migrate() again only applies what is new. Never edit a released
+# migration; add a new one instead.
+MIGRATIONS = [
+    (1, 'Create users and orders tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            last_name TEXT,
+            email TEXT,
+            age INTEGER,
+            gender TEXT,
+            state TEXT,
+            street_address TEXT,
+            postal_code TEXT,
+            city TEXT,
+            country TEXT,
+            latitude REAL,
+            longitude REAL,
+            traffic_source TEXT,
+            created_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            status TEXT,
+            gender TEXT,
+            created_at TEXT,
+            returned_at TEXT,
+            shipped_at TEXT,
+            delivered_at TEXT,
+            num_of_item INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+    ]),
+    (2, 'Index orders for per-customer lookups and newest-first listing', [
+        # Covers the customer orders query and the order_count join
+        '''
+        CREATE INDEX IF NOT EXISTS idx_orders_user_created
+        ON orders (user_id, created_at, status, shipped_at, delivered_at,
+                   returned_at, num_of_item)
+        ''',
+        # Serves ORDER BY created_at DESC, order_id DESC (order_id is the rowid)
+        'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at)',
+        'ANALYZE',
+    ]),
+    (3, 'Track a change counter per table for cache invalidation', [
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO table_versions (table_name, updated_at)
+        VALUES ('users', CURRENT_TIMESTAMP), ('orders', CURRENT_TIMESTAMP)
+        ''',
+        *_version_triggers('users'),
+        *_version_triggers('orders'),
+    ]),
+    (4, 'Materialize /api/statistics and keep it current with triggers', [
+        # Orders per customer, so COUNT(DISTINCT user_id) can be kept incrementally
+        '''
+        CREATE TABLE IF NOT EXISTS user_order_summary (
+            user_id INTEGER PRIMARY KEY,
+            order_count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS order_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            unique_customers INTEGER NOT NULL,
+            total_orders INTEGER NOT NULL,
+            items_total INTEGER NOT NULL,
+            items_counted INTEGER NOT NULL,
+            delivered_orders INTEGER NOT NULL,
+            returned_orders INTEGER NOT NULL,
+            updated_at TEXT
+        )
+        ''',
+        '''
+        INSERT INTO user_order_summary (user_id, order_count)
+        SELECT user_id, COUNT(*) FROM orders
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+        ''',
+        '''
+        INSERT INTO order_stats
+        SELECT 1,
+               COUNT(DISTINCT user_id),
+               COUNT(*),
+               COALESCE(SUM(num_of_item), 0),
+               COUNT(num_of_item),
+               COUNT(CASE WHEN status = 'delivered' THEN 1 END),
+               COUNT(CASE WHEN status = 'returned' THEN 1 END),
+               CURRENT_TIMESTAMP
+        FROM orders
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_insert
+        AFTER INSERT ON orders
+        BEGIN
+            {_ORDER_STATS_ADD}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_delete
+        AFTER DELETE ON orders
+        BEGIN
+            {_ORDER_STATS_REMOVE}
+        END
+        ''',
+        # An update counts as removing the old row and adding the new one
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_update
+        AFTER UPDATE OF user_id, status, num_of_item ON orders
+        BEGIN
+            {_ORDER_STATS_REMOVE}
+            {_ORDER_STATS_ADD}
+        END
+        ''',
+    ]),
+    (5, 'Full-text search index over customer names, email and location', [
+        # External content table: the index stores tokens, users keeps the rows.
+        # prefix='2 3' adds prefix indexes so short typeahead terms stay fast.
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            first_name, last_name, email, city, state,
+            content='users', content_rowid='id', prefix='2 3'
+        )
+        ''',
+        "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+        # ORDER BY rank weights name matches above email, city and state
+        "INSERT INTO users_fts (users_fts, rank) VALUES ('rank', 'bm25(10.0, 10.0, 5.0, 2.0, 1.0)')",
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert
+        AFTER INSERT ON users
+        BEGIN
+            INSERT INTO users_fts (rowid, first_name, last_name, email, city, state)
+            VALUES (NEW.id, NEW.first_name, NEW.last_name, NEW.email, NEW.city, NEW.state);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete
+        AFTER DELETE ON users
+        BEGIN
+            INSERT INTO users_fts (users_fts, rowid, first_name, last_name, email, city, state)
+            VALUES ('delete', OLD.id, OLD.first_name, OLD.last_name, OLD.email, OLD.city, OLD.state);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update
+        AFTER UPDATE OF id, first_name, last_name, email, city, state ON users
+        BEGIN
+            INSERT INTO users_fts (users_fts, rowid, first_name, last_name, email, city, state)
+            VALUES ('delete', OLD.id, OLD.first_name, OLD.last_name, OLD.email, OLD.city, OLD.state);
+            INSERT INTO users_fts (rowid, first_name, last_name, email, city, state)
+            VALUES (NEW.id, NEW.first_name, NEW.last_name, NEW.email, NEW.city, NEW.state);
+        END
+        ''',
+    ]),
+    (6, 'Log changed customers and orders for delta loads and targeted cache invalidation', [
+        # High-water mark of the timestamps already loaded, per table
+        '''
+        CREATE TABLE IF NOT EXISTS load_state (
+            table_name TEXT PRIMARY KEY,
+            high_water TEXT,
+            loaded_at TEXT
+        )
+        ''',
+        # AUTOINCREMENT so seq never goes backwards, even after pruning;
+        # entity '*' means "everything changed" (written by bulk loads)
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER
+        )
+        ''',
+        *_change_log_triggers('users', [("'user'", '{row}.id')]),
+        # An order also changes its customer's order count and order list
+        *_change_log_triggers('orders', [("'order'", '{row}.order_id'),
+                                         ("'user'", '{row}.user_id')]),
+    ]),
+    (7, 'Roll orders up per day, status, gender and country for time-series analytics', [
+        # Orders bucketed by the day they were placed (UTC); shipped, delivered
+        # and returned count how many of them have reached that step. Unknown
+        # dimension values are stored as '' so they can be part of the key.
+        '''
+        CREATE TABLE IF NOT EXISTS order_daily_rollup (
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            gender TEXT NOT NULL,
+            country TEXT NOT NULL,
+            orders INTEGER NOT NULL,
+            items INTEGER NOT NULL,
+            shipped INTEGER NOT NULL,
+            delivered INTEGER NOT NULL,
+            returned INTEGER NOT NULL,
+            PRIMARY KEY (day, status, gender, country)
+        ) WITHOUT ROWID
+        ''',
+        _ROLLUP_BACKFILL,
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_insert
+        AFTER INSERT ON orders
+        BEGIN
+            {_rollup_order('NEW', '+')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_delete
+        AFTER DELETE ON orders
+        BEGIN
+            {_rollup_order('OLD', '-')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_update
+        AFTER UPDATE OF user_id, status, gender, created_at, shipped_at, delivered_at,
+                        returned_at, num_of_item ON orders
+        BEGIN
+            {_rollup_order('OLD', '-')}
+            {_rollup_order('NEW', '+')}
+        END
+        ''',
+        # Orders take their country from the customer, so customer writes move them
+        f'''
+        CREATE TRIGGER IF NOT EXISTS users_rollup_insert
+        AFTER INSERT ON users
+        BEGIN
+            {_rollup_move_customer('NEW.id', "''", 'NEW.country')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS users_rollup_delete
+        AFTER DELETE ON users
+        BEGIN
+            {_rollup_move_customer('OLD.id', 'OLD.country', "''")}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS users_rollup_update
+        AFTER UPDATE OF id, country ON users
+        BEGIN
+            {_rollup_move_customer('OLD.id', 'OLD.country', "''")}
+            {_rollup_move_customer('NEW.id', "''", 'NEW.country')}
+        END
+        ''',
+    ]),
+    (8, 'Summarize every customer\'s orders for details, top-N, segments and cohorts', [
+        'ALTER TABLE user_order_summary ADD COLUMN total_items INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE user_order_summary ADD COLUMN return_count INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE user_order_summary ADD COLUMN first_order_at TEXT',
+        'ALTER TABLE user_order_summary ADD COLUMN last_order_at TEXT',
+        'DELETE FROM user_order_summary',
+        *_SUMMARY_BACKFILL,
+        # Customers without orders now keep a row, so the triggers no longer
+        # delete it at zero (only rows for user_ids missing from users go)
+        'DROP TRIGGER IF EXISTS orders_stats_insert',
+        'DROP TRIGGER IF EXISTS orders_stats_delete',
+        'DROP TRIGGER IF EXISTS orders_stats_update',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_insert
+        AFTER INSERT ON orders
+        BEGIN
+            {_ORDER_SUMMARY_ADD}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_delete
+        AFTER DELETE ON orders
+        BEGIN
+            {_ORDER_SUMMARY_REMOVE}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS orders_stats_update
+        AFTER UPDATE OF user_id, status, created_at, num_of_item ON orders
+        BEGIN
+            {_ORDER_SUMMARY_REMOVE}
+            {_ORDER_SUMMARY_ADD}
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_summary_insert
+        AFTER INSERT ON users
+        BEGIN
+            INSERT INTO user_order_summary (user_id) VALUES (NEW.id)
+            ON CONFLICT (user_id) DO NOTHING;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_summary_delete
+        AFTER DELETE ON users
+        BEGIN
+            DELETE FROM user_order_summary WHERE user_id = OLD.id AND order_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_summary_update
+        AFTER UPDATE OF id ON users
+        BEGIN
+            DELETE FROM user_order_summary WHERE user_id = OLD.id AND order_count <= 0;
+            INSERT INTO user_order_summary (user_id) VALUES (NEW.id)
+            ON CONFLICT (user_id) DO NOTHING;
+        END
+        ''',
+        # Top-N and range filters walk one of these; the rowid (user_id)
+        # breaks ties, so ORDER BY metric, user_id needs no sort
+        'CREATE INDEX IF NOT EXISTS idx_summary_order_count ON user_order_summary (order_count)',
+        'CREATE INDEX IF NOT EXISTS idx_summary_total_items ON user_order_summary (total_items)',
+        'CREATE INDEX IF NOT EXISTS idx_summary_return_count ON user_order_summary (return_count)',
+        'CREATE INDEX IF NOT EXISTS idx_summary_first_order ON user_order_summary (first_order_at)',
+        'CREATE INDEX IF NOT EXISTS idx_summary_last_order ON user_order_summary (last_order_at)',
+        # Cohort counts group on the first order's month in this index's
+        # order, and it holds the columns they sum so the table is not read
+        '''
+        CREATE INDEX IF NOT EXISTS idx_summary_cohort
+        ON user_order_summary (substr(first_order_at, 1, 7), order_count, total_items, return_count)
+        ''',
+        'ANALYZE user_order_summary',
+    ]),
+    (9, 'Index the filters of the order and customer lists', [
+        # Each serves its filter in the list's default order: orders newest
+        # first (created_at, then the rowid), customers by id (the rowid)
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_gender_created ON orders (gender, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_users_state ON users (state)',
+        'CREATE INDEX IF NOT EXISTS idx_users_country ON users (country)',
+        'CREATE INDEX IF NOT EXISTS idx_users_gender ON users (gender)',
+        'CREATE INDEX IF NOT EXISTS idx_users_age ON users (age)',
+        'CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at)',
+        'ANALYZE orders',
+        'ANALYZE users',
+    ]),
+]
+
+
+def rebuild_derived(conn):
+    """Recompute everything the triggers normally keep current
+
+    Used after a bulk load that ran with the triggers dropped. Runs inside
+    the caller's transaction; the caller commits.
+    """
+    conn.execute('DELETE FROM user_order_summary')
+    for statement in _SUMMARY_BACKFILL:
+        conn.execute(statement)
+    conn.execute('DELETE FROM order_stats')
+    conn.execute('''
+        INSERT INTO order_stats
+        SELECT 1,
+               (SELECT COUNT(*) FROM user_order_summary WHERE order_count > 0),
+               COUNT(*),
+               COALESCE(SUM(num_of_item), 0),
+               COUNT(num_of_item),
+               COUNT(CASE WHEN status = 'delivered' THEN 1 END),
+               COUNT(CASE WHEN status = 'returned' THEN 1 END),
+               CURRENT_TIMESTAMP
+        FROM orders
+    ''')
+    conn.execute('DELETE FROM order_daily_rollup')
+    conn.execute(_ROLLUP_BACKFILL)
+    conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO users_fts (users_fts) VALUES ('optimize')")
+    # Caches and ETags key off these counters
+    conn.execute('''
+        UPDATE table_versions
+        SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE table_name IN ('users', 'orders')
+    ''')
+    # Per-row entries no longer describe the data; tell readers to drop everything
+    conn.execute('DELETE FROM change_log')
+    conn.execute("INSERT INTO change_log (entity) VALUES ('*')")
+
+
+def get_schema_version(conn):
+    """Return the last migration version applied to the database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations in order and return the versions applied"""
+    applied = []
+    current = get_schema_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        # Each migration and its version bump commit together or not at all
+        conn.execute('BEGIN')
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+if __name__ == '__main__':
+    import sys
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'ecommerce.db')
+    for version, description in migrate(conn):
+        print(f"Applied migration {version}: {description}")
+    print(f"Schema version: {get_schema_version(conn)}")
+    conn.close()
@@ -0,0 +1,69 @@
+import base64
+import binascii
+import json
+
+import queries
+
+# SQLite integers are signed 64-bit; larger values cannot even be bound
+SQLITE_INT_MIN, SQLITE_INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+# Largest ?per_page= the list endpoints serve
+MAX_PER_PAGE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def page_error(page, per_page):
+    """Why a page/per_page pair cannot be served, or None if it can"""
+    if page < 1:
+        return 'Page number must be greater than 0'
+    if per_page < 1 or per_page > MAX_PER_PAGE:
+        return f'Per page must be between 1 and {MAX_PER_PAGE}'
+    # The page's OFFSET has to fit in a SQLite integer
+    if (page - 1) * per_page > SQLITE_INT_MAX:
+        return 'Page number is too large'
+    return None
+
+
+def encode_cursor(*values):
+    """Pack the sort key of the last row on a page into an opaque cursor string"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, types):
+    """Unpack a cursor made by encode_cursor, checking each value against types"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != len(types):
+        raise InvalidCursor('Invalid cursor')
+    for value, expected in zip(values, types):
+        # bool is an int subclass, so rule it out explicitly
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise InvalidCursor('Invalid cursor')
+        if isinstance(value, int) and not SQLITE_INT_MIN <= value <= SQLITE_INT_MAX:
+            raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def fetch_orders_after(conn, cursor, limit):
+    """Fetch up to limit orders that sort after the (created_at, order_id) cursor"""
+    if cursor is None:
+        return conn.execute(queries.ORDERS_FIRST, (limit,)).fetchall()
+
+    created_at, order_id = cursor
+    if created_at is None:
+        return conn.execute(queries.ORDERS_UNDATED_AFTER, (order_id, limit)).fetchall()
+
+    orders = conn.execute(queries.ORDERS_AFTER, (created_at, order_id, limit)).fetchall()
+
+    # Running out of dated orders moves on to the undated tail
+    if len(orders) < limit:
+        orders += conn.execute(queries.ORDERS_UNDATED, (limit - len(orders),)).fetchall()
+    return orders
@@ -0,0 +1,153 @@
+# SQL used by the API endpoints in app.py.
+# Kept in one place so test_query_plans.py can check every statement's plan.
+
+# --- Customers ---
+CUSTOMERS_COUNT = 'SELECT COUNT(*) FROM users'
+
+CUSTOMER_COLUMNS = '''
+    SELECT id, first_name, last_name, email, age, gender,
+           state, city, country, created_at
+    FROM users
+'''
+
+CUSTOMERS_PAGE = CUSTOMER_COLUMNS + '''
+    ORDER BY id
+    LIMIT ? OFFSET ?
+'''
+
+CUSTOMERS_AFTER = CUSTOMER_COLUMNS + '''
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+
+# Order totals come from user_order_summary, kept current by triggers
+CUSTOMER_DETAILS = '''
+    SELECT u.id, u.first_name, u.last_name, u.email, u.age, u.gender,
+           u.state, u.city, u.country, u.created_at,
+           COALESCE(s.order_count, 0) as order_count,
+           COALESCE(s.total_items, 0) as total_items,
+           COALESCE(s.return_count, 0) as return_count,
+           s.first_order_at, s.last_order_at
+    FROM users u
+    LEFT JOIN user_order_summary s ON s.user_id = u.id
+    WHERE u.id = ?
+'''
+
+# Batch form of CUSTOMER_DETAILS; the parameter is a JSON array of ids
+CUSTOMERS_DETAILS_BY_IDS = '''
+    SELECT u.id, u.first_name, u.last_name, u.email, u.age, u.gender,
+           u.state, u.city, u.country, u.created_at,
+           COALESCE(s.order_count, 0) as order_count,
+           COALESCE(s.total_items, 0) as total_items,
+           COALESCE(s.return_count, 0) as return_count,
+           s.first_order_at, s.last_order_at
+    FROM users u
+    LEFT JOIN user_order_summary s ON s.user_id = u.id
+    WHERE u.id IN (SELECT value FROM json_each(?))
+'''
+
+CUSTOMER_EXISTS = 'SELECT id FROM users WHERE id = ?'
+
+CUSTOMER_ORDERS = '''
+    SELECT order_id, status, created_at, shipped_at, delivered_at,
+           returned_at, num_of_item
+    FROM orders
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+'''
+
+# Full-text search; the parameter is an FTS5 query such as '"jo"* "smi"*'
+CUSTOMER_SEARCH = '''
+    SELECT u.id, u.first_name, u.last_name, u.email, u.age, u.gender,
+           u.state, u.city, u.country, u.created_at
+    FROM users_fts
+    JOIN users u ON u.id = users_fts.rowid
+    WHERE users_fts MATCH ?
+    ORDER BY rank
+    LIMIT ? OFFSET ?
+'''
+
+CUSTOMER_SEARCH_COUNT = 'SELECT COUNT(*) FROM users_fts WHERE users_fts MATCH ?'
+
+# --- Orders ---
+ORDERS_COUNT = 'SELECT COUNT(*) FROM orders'
+
+ORDER_COLUMNS = '''
+    SELECT o.order_id, o.user_id, o.status, o.created_at, o.shipped_at,
+           o.delivered_at, o.returned_at, o.num_of_item,
+           u.first_name, u.last_name, u.email
+    FROM orders o
+    LEFT JOIN users u ON o.user_id = u.id
+'''
+
+ORDERS_PAGE = ORDER_COLUMNS + '''
+    ORDER BY o.created_at DESC, o.order_id DESC
+    LIMIT ? OFFSET ?
+'''
+
+ORDERS_FIRST = ORDER_COLUMNS + '''
+    ORDER BY o.created_at DESC, o.order_id DESC
+    LIMIT ?
+'''
+
+ORDERS_AFTER = ORDER_COLUMNS + '''
+    WHERE (o.created_at, o.order_id) < (?, ?)
+    ORDER BY o.created_at DESC, o.order_id DESC
+    LIMIT ?
+'''
+
+# Orders without a created_at sort last, ordered by order_id alone
+ORDERS_UNDATED = ORDER_COLUMNS + '''
+    WHERE o.created_at IS NULL
+    ORDER BY o.order_id DESC
+    LIMIT ?
+'''
+
+ORDERS_UNDATED_AFTER = ORDER_COLUMNS + '''
+    WHERE o.created_at IS NULL AND o.order_id < ?
+    ORDER BY o.order_id DESC
+    LIMIT ?
+'''
+
+ORDER_DETAILS = ORDER_COLUMNS + '''
+    WHERE o.order_id = ?
+'''
+
+# Batch form of ORDER_DETAILS; the parameter is a JSON array of ids
+ORDERS_DETAILS_BY_IDS = ORDER_COLUMNS + '''
+    WHERE o.order_id IN (SELECT value FROM json_each(?))
+'''
+
+# --- Statistics ---
+# Maintained by triggers on orders (see migrations.py), so this is a single row read
+MATERIALIZED_STATISTICS = '''
+    SELECT unique_customers, total_orders,
+           CASE WHEN items_counted > 0 THEN items_total * 1.0 / items_counted END
+               as avg_items_per_order,
+           delivered_orders, returned_orders, updated_at
+    FROM order_stats
+    WHERE id = 1
+'''
+
+# Exact recompute over the whole orders table, for ?fresh=1
+STATISTICS = '''
+    SELECT
+        COUNT(DISTINCT user_id) as unique_customers,
+        COUNT(*) as total_orders,
+        AVG(num_of_item) as avg_items_per_order,
+        COUNT(CASE WHEN status = 'delivered' THEN 1 END) as delivered_orders,
+        COUNT(CASE WHEN status = 'returned' THEN 1 END) as returned_orders
+    FROM orders
+'''
+
+# Every order's fulfillment timestamps with its customer's state, for the
+# columnar arrays behind /api/analytics/fulfillment (read once per data change).
+# julianday() parses the timestamps in SQLite, far faster than pandas would.
+FULFILLMENT_ORDERS = '''
+    SELECT o.status, u.state,
+           julianday(o.created_at), julianday(o.shipped_at),
+           julianday(o.delivered_at), julianday(o.returned_at)
+    FROM orders o
+    LEFT JOIN users u ON u.id = o.user_id
+'''
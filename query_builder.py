@@ -0,0 +1,173 @@
+from collections import namedtuple
+from datetime import datetime
+
+import queries
+from pagination import SQLITE_INT_MIN, SQLITE_INT_MAX
+from serializers import Rows
+from timestamps import parse_timestamp
+
+# What a list endpoint may filter and sort on. filters maps a query parameter
+# to (column, operator, type); sorts maps a sort key to its column. Only
+# columns some index can serve are listed; the plan check catches the rest.
+ListSpec = namedtuple('ListSpec', 'table select filters sorts default_sort tiebreak')
+
+ORDERS = ListSpec(
+    table='orders o',
+    select=queries.ORDER_COLUMNS,
+    filters={
+        'status': ('o.status', '=', str),
+        'gender': ('o.gender', '=', str),
+        'user_id': ('o.user_id', '=', int),
+        'start': ('o.created_at', '>=', datetime),
+        'end': ('o.created_at', '<', datetime),
+    },
+    sorts={'created_at': 'o.created_at', 'order_id': 'o.order_id'},
+    default_sort='-created_at',
+    tiebreak='o.order_id',
+)
+
+CUSTOMERS = ListSpec(
+    table='users',
+    select=queries.CUSTOMER_COLUMNS,
+    filters={
+        'state': ('state', '=', str),
+        'country': ('country', '=', str),
+        'gender': ('gender', '=', str),
+        'min_age': ('age', '>=', int),
+        'max_age': ('age', '<=', int),
+        'start': ('created_at', '>=', datetime),
+        'end': ('created_at', '<', datetime),
+    },
+    sorts={'id': 'id', 'created_at': 'created_at', 'age': 'age'},
+    default_sort='id',
+    tiebreak='id',
+)
+
+# Verdicts per SQL text. Parameters are bound, so the text identifies the
+# filter/sort combination and its plan; there are only a few hundred.
+_plan_verdicts = {}
+
+
+class InvalidListQuery(ValueError):
+    """Raised when a filter or sort parameter cannot be used"""
+
+
+class UnindexedQuery(InvalidListQuery):
+    """Raised when no index can return the rows in the requested order"""
+
+
+ListQuery = namedtuple('ListQuery', 'sql params count_sql count_params filters sort')
+
+
+def parse_filter_value(name, value, kind):
+    """Convert a filter parameter to the type its column is compared with"""
+    if kind is int:
+        try:
+            number = int(value)
+        except ValueError:
+            raise InvalidListQuery(f'{name} must be an integer')
+        if not SQLITE_INT_MIN <= number <= SQLITE_INT_MAX:
+            raise InvalidListQuery(f'{name} is out of range')
+        return number
+    if kind is datetime:
+        try:
+            return parse_timestamp(value)
+        except ValueError:
+            raise InvalidListQuery(f'{name} must be an ISO date such as 2022-01-31')
+    return value
+
+
+def wants_list_query(spec, args):
+    """True if the request filters or sorts, rather than listing in the default order"""
+    return 'sort' in args or any(name in args for name in spec.filters)
+
+
+def build_list_query(spec, args, limit, offset):
+    """Parameterized page and count SQL for the filters and ?sort=[-]key in args"""
+    clauses, params, filters = [], [], {}
+    for name, (column, operator, kind) in spec.filters.items():
+        value = args.get(name)
+        if value is None or value == '':
+            continue
+        filters[name] = parse_filter_value(name, value, kind)
+        clauses.append(f'{column} {operator} ?')
+        params.append(filters[name])
+
+    sort = args.get('sort') or spec.default_sort
+    key = sort[1:] if sort.startswith('-') else sort
+    if key not in spec.sorts:
+        raise InvalidListQuery(f'sort must be one of: {", ".join(spec.sorts)} (prefix - for descending)')
+    direction = ' DESC' if sort.startswith('-') else ''
+    order_by = [spec.sorts[key] + direction]
+    if spec.sorts[key] != spec.tiebreak:
+        # Equal sort values keep a stable order across pages
+        order_by.append(spec.tiebreak + direction)
+
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    sql = f"{spec.select}{where} ORDER BY {', '.join(order_by)} LIMIT ? OFFSET ?"
+    count_sql = f'SELECT COUNT(*) FROM {spec.table}{where}'
+    return ListQuery(sql, params + [limit, offset], count_sql, params, filters, sort)
+
+
+def check_plan(conn, query):
+    """Refuse a query SQLite would have to sort in a temp B-tree; return warnings
+
+    A full temp B-tree sort reads every matching row before returning the
+    first, so it is refused. Sorting only the "right part" (rows tied on an
+    index-ordered prefix, such as one customer's orders on the same
+    timestamp) still stops at LIMIT and is fine. A filter no index serves
+    (the table is walked and each row tested) works, with a warning.
+    """
+    verdict = _plan_verdicts.get(query.sql)
+    if verdict is None:
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query.sql, query.params)]
+        if 'USE TEMP B-TREE FOR ORDER BY' in plan:
+            verdict = ('sort', [])
+        elif query.filters and any(detail.startswith('SCAN ') for detail in plan):
+            verdict = ('ok', [f'No index serves filtering on {", ".join(query.filters)} '
+                              f'sorted by {query.sort.lstrip("-")}; rows are found by walking '
+                              'the table, so rare values can be slow'])
+        else:
+            verdict = ('ok', [])
+        _plan_verdicts[query.sql] = verdict
+
+    outcome, warnings = verdict
+    if outcome == 'sort':
+        raise UnindexedQuery(
+            f'Sorting by {query.sort.lstrip("-")} is not supported together with '
+            f'{", ".join(query.filters) or "no filters"}; no index returns those rows in that order'
+        )
+    return warnings
+
+
+def list_page(conn, spec, name, args, page, per_page, include_total=True):
+    """Run the filtered, sorted page the arguments ask for and build its response body
+
+    The query is refused (UnindexedQuery) if no index can return its rows
+    in order; filters that make SQLite walk the table come back as warnings.
+    """
+    query = build_list_query(spec, args, per_page + 1, (page - 1) * per_page)
+    warnings = check_plan(conn, query)
+
+    rows = conn.execute(query.sql, query.params).fetchall()
+    has_next = len(rows) > per_page
+
+    total_count = total_pages = None
+    if include_total:
+        total_count = conn.execute(query.count_sql, query.count_params).fetchone()[0]
+        total_pages = (total_count + per_page - 1) // per_page
+
+    return {
+        name: Rows(rows[:per_page]),
+        'filters': query.filters,
+        'sort': query.sort,
+        'warnings': warnings,
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'total_count': total_count,
+            'total_pages': total_pages,
+            'has_next': has_next,
+            'has_prev': page > 1
+        }
+    }
@@ -0,0 +1,159 @@
+from datetime import date, timedelta
+
+from pagination import SQLITE_INT_MIN, SQLITE_INT_MAX
+
+# Summary columns customers can be ranked and filtered by; each has its own index
+METRICS = ('order_count', 'total_items', 'return_count', 'first_order_at', 'last_order_at')
+
+DATE_METRICS = ('first_order_at', 'last_order_at')
+
+# Most customers a top-N request returns
+MAX_TOP = 100
+
+SUMMARY_COLUMNS = '''
+    SELECT u.id, u.first_name, u.last_name, u.email, u.state, u.country,
+           s.order_count, s.total_items, s.return_count, s.first_order_at, s.last_order_at
+    FROM user_order_summary s
+    JOIN users u ON u.id = s.user_id
+'''
+
+
+class InvalidSegmentQuery(ValueError):
+    """Raised when a top-N, segment or cohort parameter cannot be used"""
+
+
+def parse_metric(args):
+    """The summary column named by ?by=, order_count by default"""
+    metric = args.get('by', 'order_count')
+    if metric not in METRICS:
+        raise InvalidSegmentQuery(f'by must be one of: {", ".join(METRICS)}')
+    return metric
+
+
+def parse_bound(args, name, metric):
+    """A min/max parameter: an integer, or an ISO date for the date metrics"""
+    value = args.get(name)
+    if value is None:
+        return None
+    if metric in DATE_METRICS:
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise InvalidSegmentQuery(f'{name} must be a date such as 2022-01-31 when ranking by {metric}')
+    try:
+        bound = int(value)
+    except ValueError:
+        raise InvalidSegmentQuery(f'{name} must be an integer when ranking by {metric}')
+    if not SQLITE_INT_MIN <= bound <= SQLITE_INT_MAX:
+        raise InvalidSegmentQuery(f'{name} is out of range')
+    return bound
+
+
+def parse_segment_args(args):
+    """Return metric, min and max (both inclusive, either optional) from the query string"""
+    metric = parse_metric(args)
+    low = parse_bound(args, 'min', metric)
+    high = parse_bound(args, 'max', metric)
+    if low is not None and high is not None and low > high:
+        raise InvalidSegmentQuery('min must not be greater than max')
+    return metric, low, high
+
+
+def parse_month(args, name):
+    """A YYYY-MM cohort parameter"""
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        date.fromisoformat(value + '-01')
+    except ValueError:
+        raise InvalidSegmentQuery(f'{name} must be a month such as 2022-01')
+    return value
+
+
+def top_query(metric, limit):
+    """Customers with the highest metric, read backwards off the metric's index"""
+    sql = SUMMARY_COLUMNS + f'''
+        ORDER BY s.{metric} DESC, s.user_id DESC
+        LIMIT ?
+    '''
+    return sql, [limit]
+
+
+def range_clauses(metric, low, high):
+    """WHERE clauses and parameters for min <= metric <= max
+
+    Dates are stored as timestamps, so max covers its whole day.
+    """
+    clauses, params = [], []
+    if low is not None:
+        clauses.append(f's.{metric} >= ?')
+        params.append(low.isoformat() if metric in DATE_METRICS else low)
+    if high is not None:
+        if metric in DATE_METRICS and high == date.max:
+            # No next day to stop before; the end of the day sorts after every time on it
+            clauses.append(f's.{metric} <= ?')
+            params.append(f'{high.isoformat()} 24:00:00')
+        elif metric in DATE_METRICS:
+            clauses.append(f's.{metric} < ?')
+            params.append((high + timedelta(days=1)).isoformat())
+        else:
+            clauses.append(f's.{metric} <= ?')
+            params.append(high)
+    if not clauses and metric in DATE_METRICS:
+        # Without bounds, customers who never ordered have no date to rank
+        clauses.append(f's.{metric} IS NOT NULL')
+    return clauses, params
+
+
+def segment_query(metric, low, high, limit, offset):
+    """One page of customers whose metric is in range, in metric then id order"""
+    clauses, params = range_clauses(metric, low, high)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = SUMMARY_COLUMNS + f'''
+        {where}
+        ORDER BY s.{metric}, s.user_id
+        LIMIT ? OFFSET ?
+    '''
+    return sql, params + [limit, offset]
+
+
+def segment_count_query(metric, low, high):
+    """How many customers segment_query matches in total"""
+    clauses, params = range_clauses(metric, low, high)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f'''
+        SELECT COUNT(*)
+        FROM user_order_summary s
+        JOIN users u ON u.id = s.user_id
+        {where}
+    '''
+    return sql, params
+
+
+def cohort_query(start, end):
+    """Customers per month of their first order, read from idx_summary_cohort alone
+
+    start and end are YYYY-MM months, end exclusive. The expression must
+    match the index's exactly for SQLite to use it.
+    """
+    clauses, params = ['substr(first_order_at, 1, 7) IS NOT NULL'], []
+    if start:
+        clauses.append('substr(first_order_at, 1, 7) >= ?')
+        params.append(start)
+    if end:
+        clauses.append('substr(first_order_at, 1, 7) < ?')
+        params.append(end)
+    sql = f'''
+        SELECT substr(first_order_at, 1, 7) AS cohort,
+               COUNT(*) AS customers,
+               COUNT(CASE WHEN order_count > 1 THEN 1 END) AS repeat_customers,
+               SUM(order_count) AS orders,
+               SUM(total_items) AS items,
+               SUM(return_count) AS returns
+        FROM user_order_summary
+        WHERE {' AND '.join(clauses)}
+        GROUP BY substr(first_order_at, 1, 7)
+        ORDER BY cohort
+    '''
+    return sql, params
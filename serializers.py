@@ -0,0 +1,135 @@
+import json
+import sqlite3
+from json.encoder import encode_basestring_ascii
+from operator import itemgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+# Response bodies are compact, key-sorted, ASCII-only JSON (Flask's jsonify
+# outside debug mode). Lists of result rows are the bulk of most bodies, so
+# they are encoded straight from the sqlite3.Row tuples through a template
+# built once per column list, instead of a dict per row going through
+# json.dumps. Everything else goes through the stdlib encoder as before.
+
+INFINITY = float('inf')
+
+
+def encode_float(value):
+    """A float exactly as json.dumps writes it, NaN and infinities included"""
+    if value != value:
+        return 'NaN'
+    if value == INFINITY:
+        return 'Infinity'
+    if value == -INFINITY:
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+# Encoders for the types SQLite returns; other values go through json.dumps
+VALUE_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: encode_float,
+    type(None): lambda value: 'null',
+}
+
+
+class Rows(list):
+    """Query result rows to serialize as a JSON array of objects
+
+    It is still a list of sqlite3.Row, so handlers can read the last row's
+    id for a cursor, and encoders that do not know it fall back to one
+    dict per row.
+    """
+
+
+class RowEncoder:
+    """Encode rows with a fixed column list as JSON objects
+
+    The keys (sorted, or in column order for sort_keys=False) are written
+    into a %-template once, so per row only the values are encoded.
+    """
+
+    def __init__(self, columns, sort_keys=True, default=None):
+        columns = list(columns)
+        order = sorted(range(len(columns)), key=columns.__getitem__) if sort_keys else range(len(columns))
+        order = list(order)
+        self.template = '{' + ','.join(f'{encode_basestring_ascii(columns[i])}:%s' for i in order) + '}'
+        # itemgetter with one index returns the bare value, not a tuple
+        self.values = itemgetter(*order) if len(order) > 1 else lambda row: (row[order[0]],)
+        self.fallback = json.JSONEncoder(sort_keys=True, separators=(',', ':'), default=default).encode
+
+    def encode(self, row):
+        """One row as a JSON object"""
+        encoder_for, fallback = VALUE_ENCODERS.get, self.fallback
+        return self.template % tuple([(encoder_for(type(value)) or fallback)(value) for value in self.values(row)])
+
+    def encode_many(self, rows):
+        """Rows as a JSON array of objects"""
+        # encode() inlined: a method call per row is a noticeable share of a large page
+        template, values = self.template, self.values
+        encoder_for, fallback = VALUE_ENCODERS.get, self.fallback
+        return '[' + ','.join([
+            template % tuple([(encoder_for(type(value)) or fallback)(value) for value in values(row)])
+            for row in rows
+        ]) + ']'
+
+
+# Row encoders per column list; a handful of queries produce every result shape
+_row_encoders = {}
+
+
+def row_encoder(columns, sort_keys=True, default=None):
+    """The shared RowEncoder for a column list"""
+    key = (tuple(columns), sort_keys, default)
+    encoder = _row_encoders.get(key)
+    if encoder is None:
+        encoder = _row_encoders[key] = RowEncoder(columns, sort_keys, default)
+    return encoder
+
+
+def _encode(value, encode, default):
+    """Encode value, taking the row path for Rows anywhere among nested dict values"""
+    if type(value) is Rows:
+        if not value:
+            return '[]'
+        if not isinstance(value[0], sqlite3.Row):
+            return encode(value)
+        return row_encoder(value[0].keys(), default=default).encode_many(value)
+    if type(value) is dict and all(type(key) is str for key in value):
+        return '{' + ','.join(
+            f'{encode_basestring_ascii(key)}:{_encode(value[key], encode, default)}'
+            for key in sorted(value)
+        ) + '}'
+    return encode(value)
+
+
+def dumps(payload, default=None):
+    """Encode a response payload exactly as jsonify does outside debug mode, minus the newline"""
+    encode = json.JSONEncoder(sort_keys=True, separators=(',', ':'), default=rows_as_dicts(default)).encode
+    return _encode(payload, encode, default)
+
+
+def rows_as_dicts(default):
+    """A json default hook that also turns sqlite3.Row into a dict"""
+    def encode_row(value):
+        if isinstance(value, sqlite3.Row):
+            return dict(value)
+        if default is None:
+            raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+        return default(value)
+    return encode_row
+
+
+class RowJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that takes the row path for compact, sorted, ASCII output
+
+    Debug mode (indented output) and any other settings go through the
+    default provider, with rows turned into dicts on the way.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs == {'separators': (',', ':')} and self.sort_keys and self.ensure_ascii:
+            return dumps(obj, default=self.default)
+        kwargs['default'] = rows_as_dicts(self.default)
+        return super().dumps(obj, **kwargs)
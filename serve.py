@@ -0,0 +1,229 @@
+import argparse
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from db import DATABASE, migrate_database
+
+# Production launcher for app.py: one listening socket, N forked worker processes.
+#   python serve.py --workers 4
+# Every worker accepts from the same socket, so the kernel spreads connections
+# across them and each core runs its own interpreter (and GIL). The API never
+# writes, so workers open their connections read-only; the 256 MB mmap in
+# db.CONNECTION_PRAGMAS means they all read the same pages of the OS cache.
+
+
+class Worker:
+    """A forked worker process and the pipe it reports its health on"""
+
+    def __init__(self, pid, heartbeats):
+        self.pid = pid
+        self.heartbeats = heartbeats
+        self.started = self.last_heartbeat = time.monotonic()
+
+
+def check_health(app):
+    """Run a cheap request through the whole app stack; True if it answered"""
+    response = app.test_client().get('/api/statistics', headers={'If-None-Match': '*'})
+    return response.status_code in (200, 304)
+
+
+def heartbeat(app, pipe, interval):
+    """Write a byte to the launcher after every successful health check"""
+    while True:
+        try:
+            healthy = check_health(app)
+        except Exception:
+            healthy = False
+        if healthy:
+            try:
+                os.write(pipe, b'.')
+            except OSError:
+                # The launcher is gone; stop serving rather than linger
+                os._exit(1)
+        time.sleep(interval)
+
+
+def run_worker(listener, heartbeats, options):
+    """Serve app.py from the shared socket until told to stop; runs in the child"""
+    import db
+    # The API never writes; nothing has opened a pooled connection before the fork
+    db.pool.read_only = True
+    # Imported after the fork: SQLite connections must not cross one
+    from werkzeug.serving import make_server
+    from app import app
+
+    if not options.access_log:
+        # A log line per request costs more than a cached detail lookup
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server(options.host, options.port, app, threaded=True, fd=listener.fileno())
+    # Let requests in flight finish when the worker is stopped
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, so it cannot run on this (the serving) thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threading.Thread(target=heartbeat, args=(app, heartbeats, options.health_interval), daemon=True).start()
+    server.serve_forever()
+    server.server_close()
+
+
+class Launcher:
+    """Fork workers, restart the ones that die or stop passing health checks"""
+
+    def __init__(self, listener, options):
+        self.listener = listener
+        self.options = options
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self):
+        """Fork one worker"""
+        read_end, write_end = os.pipe()
+        # Buffered output would otherwise be printed again by the child
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            for fd in self.workers:
+                os.close(fd)
+            code = 0
+            try:
+                run_worker(self.listener, write_end, self.options)
+            except BaseException as e:
+                print(f"❌ Worker {os.getpid()} failed: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_end)
+        os.set_blocking(read_end, False)
+        self.workers[read_end] = Worker(pid, read_end)
+        print(f"🚀 Worker {pid} started")
+
+    def retire(self, worker):
+        """Forget a worker that has exited"""
+        os.close(worker.heartbeats)
+        del self.workers[worker.heartbeats]
+
+    def reap(self):
+        """Collect exited workers, returning how many there were"""
+        exited = 0
+        for worker in list(self.workers.values()):
+            pid, status = os.waitpid(worker.pid, os.WNOHANG)
+            if pid:
+                if not self.stopping:
+                    print(f"⚠️  Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}")
+                self.retire(worker)
+                exited += 1
+        return exited
+
+    def check_heartbeats(self, timeout):
+        """Read heartbeats for up to timeout seconds, then kill workers that went quiet"""
+        readable, _, _ = select.select(list(self.workers), [], [], timeout)
+        now = time.monotonic()
+        for fd in readable:
+            try:
+                if os.read(fd, 4096):
+                    self.workers[fd].last_heartbeat = now
+            except BlockingIOError:
+                pass
+        for worker in self.workers.values():
+            deadline = self.options.health_timeout
+            if worker.last_heartbeat == worker.started:
+                # Startup (imports, migrations, warming the pool) gets a grace period
+                deadline += self.options.startup_timeout
+            if now - worker.last_heartbeat > deadline:
+                print(f"⚠️  Worker {worker.pid} failed health checks for {now - worker.last_heartbeat:.0f}s, killing it")
+                os.kill(worker.pid, signal.SIGKILL)
+                # Reaped and replaced once it has exited
+                worker.last_heartbeat = now
+
+    def stop(self, signum, frame):
+        """Signal handler: leave the supervision loop and shut down"""
+        self.stopping = True
+
+    def run(self):
+        """Keep options.workers workers running until SIGTERM or Ctrl+C"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.options.workers):
+            self.spawn()
+
+        while not self.stopping:
+            try:
+                self.check_heartbeats(1.0)
+            except InterruptedError:
+                pass
+            if self.reap() and not self.stopping:
+                # A worker that dies at once would otherwise be forked in a tight loop
+                time.sleep(1.0)
+                while len(self.workers) < self.options.workers:
+                    self.spawn()
+
+        self.shutdown()
+
+    def shutdown(self):
+        """Stop the workers, giving requests in flight graceful_timeout seconds"""
+        print("🛑 Stopping workers")
+        for worker in self.workers.values():
+            os.kill(worker.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.options.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for worker in list(self.workers.values()):
+            os.kill(worker.pid, signal.SIGKILL)
+            os.waitpid(worker.pid, 0)
+            self.retire(worker)
+        self.listener.close()
+
+
+def open_listener(host, port, backlog):
+    """Bind the socket every worker accepts from"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    listener.set_inheritable(True)
+    return listener
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the API from several worker processes')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--backlog', type=int, default=1024,
+                        help='connections the kernel queues before workers accept them')
+    parser.add_argument('--health-interval', type=float, default=5,
+                        help='seconds between each worker\'s health checks')
+    parser.add_argument('--health-timeout', type=float, default=30,
+                        help='seconds without a passing health check before a worker is killed and replaced')
+    parser.add_argument('--startup-timeout', type=float, default=60,
+                        help='extra time a new worker has to pass its first check')
+    parser.add_argument('--access-log', action='store_true',
+                        help='log every request, as python app.py does')
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help='seconds stopping workers get to finish requests in flight')
+    options = parser.parse_args()
+
+    # Migrate once, with a writable connection, before any read-only worker starts
+    for version, description in migrate_database(DATABASE):
+        print(f"Applied migration {version}: {description}")
+
+    listener = open_listener(options.host, options.port, options.backlog)
+    print(f"🌐 Serving on http://{options.host}:{options.port} with {options.workers} workers")
+    Launcher(listener, options).run()
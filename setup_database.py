@@ -1,49 +1,15 @@
 import sqlite3
+from migrations import migrate, get_schema_version
 
 # Connect to a new SQLite database file (creates it if it doesn't exist)
 conn = sqlite3.connect('ecommerce.db')
-cursor = conn.cursor()
 
-# --- CREATE users table (matches CSV columns) ---
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY,
-    first_name TEXT,python setup_database.py
+# --- CREATE users and orders tables, then their indexes (see migrations.py) ---
+applied = migrate(conn)
+for version, description in applied:
+    print(f"Applied migration {version}: {description}")
 
-    last_name TEXT,
-    email TEXT,
-    age INTEGER,
-    gender TEXT,
-    state TEXT,
-    street_address TEXT,
-    postal_code TEXT,
-    city TEXT,
-    country TEXT,
-    latitude REAL,
-    longitude REAL,
-    traffic_source TEXT,
-    created_at TEXT
-);
-''')
-
-# --- CREATE orders table (you already had this correct) ---
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS orders (
-    order_id INTEGER PRIMARY KEY,
-    user_id INTEGER,
-    status TEXT,
-    gender TEXT,
-    created_at TEXT,
-    returned_at TEXT,
-    shipped_at TEXT,
-    delivered_at TEXT,
-    num_of_item INTEGER,
-    FOREIGN KEY (user_id) REFERENCES users(id)
-);
-''')
-
-# Save (commit) the changes and close the connection
-conn.commit()
+print(f"Schema version: {get_schema_version(conn)}")
 conn.close()
 
 print("Tables created successfully!")
@@ -0,0 +1,99 @@
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+               'David', 'Elizabeth', 'Zoë', 'José', 'Aiko', 'Chen', 'Fatima', 'Olga']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Potter', 'Müller', 'Nguyen', 'Kim', 'Silva', 'Rossi', "O'Brien", 'Ivanova']
+LOCATIONS = [
+    ('United States', 'California', 'Los Angeles'), ('United States', 'Texas', 'Houston'),
+    ('United States', 'New York', 'New York'), ('United States', 'Massachusetts', 'Boston'),
+    ('Brasil', 'São Paulo', 'São Paulo'), ('China', 'Guangdong', 'Shenzhen'),
+    ('United Kingdom', 'England', 'London'), ('France', 'Île-de-France', 'Paris'),
+    ('Germany', 'Bayern', 'München'), ('Japan', 'Tokyo', 'Tokyo'),
+]
+TRAFFIC_SOURCES = ['Search', 'Organic', 'Facebook', 'Email', 'Display']
+# Statuses as the statistics queries spell them, in a rough real-world mix
+STATUSES = ['delivered'] * 25 + ['shipped'] * 30 + ['processing'] * 20 + ['cancelled'] * 15 + ['returned'] * 10
+
+USERS_COLUMNS = ['id', 'first_name', 'last_name', 'email', 'age', 'gender', 'state', 'street_address',
+                 'postal_code', 'city', 'country', 'latitude', 'longitude', 'traffic_source', 'created_at']
+ORDERS_COLUMNS = ['order_id', 'user_id', 'status', 'gender', 'created_at', 'returned_at',
+                  'shipped_at', 'delivered_at', 'num_of_item']
+
+START = datetime(2019, 1, 1)
+SPAN_SECONDS = 5 * 365 * 24 * 3600
+
+
+def timestamp(value):
+    """Format a datetime the way the source CSVs do"""
+    return value.strftime('%Y-%m-%d %H:%M:%S+00:00') if value else ''
+
+
+def write_users(path, count, seed=1):
+    """Write count customers, with signups spread over five years"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(USERS_COLUMNS)
+        for user_id in range(1, count + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            country, state, city = rng.choice(LOCATIONS)
+            created = START + timedelta(seconds=SPAN_SECONDS * user_id // count)
+            writer.writerow([
+                user_id, first, last,
+                f"{first}.{last}{user_id}@example.com".lower().replace("'", ''),
+                rng.randint(12, 70), rng.choice('MF'), state,
+                f"{rng.randint(1, 9999)} {rng.choice(LAST_NAMES)} Street",
+                f"{rng.randint(0, 99999):05d}",  # leading zeros must survive loading
+                city, country,
+                round(rng.uniform(-60, 70), 6), round(rng.uniform(-180, 180), 6),
+                rng.choice(TRAFFIC_SOURCES), timestamp(created),
+            ])
+
+
+def write_orders(path, count, user_count, seed=2):
+    """Write count orders for random customers, with shipping, delivery and return times"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(ORDERS_COLUMNS)
+        for order_id in range(1, count + 1):
+            status = rng.choice(STATUSES)
+            created = START + timedelta(seconds=rng.randrange(SPAN_SECONDS))
+            shipped = delivered = returned = None
+            if status in ('shipped', 'delivered', 'returned'):
+                shipped = created + timedelta(hours=rng.randint(1, 72))
+            if status in ('delivered', 'returned'):
+                delivered = shipped + timedelta(hours=rng.randint(12, 240))
+            if status == 'returned':
+                returned = delivered + timedelta(days=rng.randint(1, 14))
+            writer.writerow([
+                order_id, rng.randint(1, user_count), status, rng.choice('MF'),
+                timestamp(created), timestamp(returned), timestamp(shipped),
+                timestamp(delivered), rng.randint(1, 4),
+            ])
+
+
+def write_dataset(directory, users, orders):
+    """Write users.csv and orders.csv into directory; returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    users_csv = os.path.join(directory, 'users.csv')
+    orders_csv = os.path.join(directory, 'orders.csv')
+    write_users(users_csv, users)
+    write_orders(orders_csv, orders, users)
+    return users_csv, orders_csv
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic users.csv and orders.csv')
+    parser.add_argument('--users', type=int, default=100000, help='number of customers')
+    parser.add_argument('--orders', type=int, default=125000, help='number of orders')
+    parser.add_argument('--out', default='synthetic', help='directory to write the CSVs to')
+    args = parser.parse_args()
+
+    for path in write_dataset(args.out, args.users, args.orders):
+        print(f"Wrote {path}")
@@ -126,6 +126,210 @@ def test_api():
             print(f"❌ Expected 404, got {response.status_code}")
     except Exception as e:
         print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 8: Cursor pagination
+    print("8. Testing GET /api/orders with cursor pagination")
+    try:
+        response = requests.get(f"{BASE_URL}/orders?per_page=5&cursor=")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 200:
+            first_page = response.json()
+            next_cursor = first_page['pagination']['next_cursor']
+            response = requests.get(f"{BASE_URL}/orders?per_page=5&cursor={next_cursor}")
+            second_page = response.json()
+            first_ids = {order['order_id'] for order in first_page['orders']}
+            second_ids = {order['order_id'] for order in second_page['orders']}
+            print(f"Orders on second page: {len(second_page['orders'])}")
+            if first_ids.isdisjoint(second_ids):
+                print("✅ Cursor pagination working!")
+            else:
+                print("❌ Cursor pages overlap")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 9: Conditional requests
+    print("9. Testing If-None-Match on GET /api/customers/1")
+    try:
+        response = requests.get(f"{BASE_URL}/customers/1")
+        etag = response.headers.get('ETag')
+        print(f"ETag: {etag}")
+        response = requests.get(f"{BASE_URL}/customers/1", headers={'If-None-Match': etag})
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 304:
+            print("✅ HTTP caching working!")
+        else:
+            print(f"❌ Expected 304, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 10: Orders time series
+    print("10. Testing GET /api/analytics/orders/timeseries")
+    try:
+        response = requests.get(f"{BASE_URL}/analytics/orders/timeseries?granularity=month")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 200:
+            series = response.json()['series']
+            print(f"Months: {len(series)}")
+            print(f"Orders counted: {sum(point['orders'] for point in series)}")
+            print("✅ Time series working!")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 11: Fulfillment latency by status
+    print("11. Testing GET /api/analytics/fulfillment")
+    try:
+        response = requests.get(f"{BASE_URL}/analytics/fulfillment?group_by=status")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 200:
+            data = response.json()
+            print(f"Orders: {data['orders']}")
+            for group in data['groups']:
+                print(f"  {group['key']}: p50 time to ship {group['time_to_ship']['p50']} {data['unit']}")
+            print("✅ Fulfillment analytics working!")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 12: Top customers and customers without orders
+    print("12. Testing GET /api/analytics/customers/top and /segment")
+    try:
+        response = requests.get(f"{BASE_URL}/analytics/customers/top?by=order_count&limit=5")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 200:
+            for customer in response.json()['customers']:
+                print(f"  {customer['id']}: {customer['order_count']} orders")
+            response = requests.get(f"{BASE_URL}/analytics/customers/segment?min=0&max=0")
+            print(f"Customers without orders: {response.json()['pagination']['total_count']}")
+            print("✅ Customer segments working!")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 13: Filtered and sorted orders
+    print("13. Testing GET /api/orders?status=returned&start=2022-01-01")
+    try:
+        response = requests.get(f"{BASE_URL}/orders?status=returned&start=2022-01-01&per_page=5")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 200:
+            data = response.json()
+            print(f"Matching orders: {data['pagination']['total_count']}")
+            print(f"Sort: {data['sort']}, warnings: {data['warnings']}")
+            if all(order['status'] == 'returned' for order in data['orders']):
+                print("✅ Order filters working!")
+            else:
+                print("❌ Orders with another status were returned")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 14: Compressed pages, and revalidating them
+    print("14. Testing GET /api/orders?per_page=100 with Accept-Encoding: gzip")
+    try:
+        response = requests.get(f"{BASE_URL}/orders?per_page=100", headers={'Accept-Encoding': 'gzip'})
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 200:
+            encoding = response.headers.get('Content-Encoding')
+            etag = response.headers.get('ETag')
+            print(f"Content-Encoding: {encoding}, ETag: {etag}, orders: {len(response.json()['orders'])}")
+            revalidated = requests.get(f"{BASE_URL}/orders?per_page=100",
+                                       headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+            if encoding == 'gzip' and revalidated.status_code == 304:
+                print("✅ Compression working!")
+            else:
+                print(f"❌ Expected a gzip body and a 304, got {encoding} and {revalidated.status_code}")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 15: Prometheus metrics
+    print("15. Testing GET /metrics")
+    try:
+        response = requests.get(f"{BASE_URL.rsplit('/api', 1)[0]}/metrics")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code == 200:
+            lines = response.text.splitlines()
+            timed = [line for line in lines if line.startswith('api_request_duration_seconds_count')]
+            queries = [line for line in lines if line.startswith('api_query_rows_total')]
+            print(f"Timed endpoints: {len(timed)}, instrumented queries: {len(queries)}")
+            if timed and any('query="ORDERS_PAGE"' in line for line in queries):
+                print("✅ Metrics working!")
+            else:
+                print("❌ Request or query metrics missing")
+        else:
+            print(f"❌ Error: {response.text}")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 16: Date filters in any ISO form select the same rows
+    print("16. Testing GET /api/export/orders and /api/orders with ISO datetime forms")
+    try:
+        forms = [
+            ('2023-12-30', '2023-12-31'),
+            ('2023-12-30T00:00:00', '2023-12-31T00:00'),
+            ('20231230', '20231231'),
+            ('2023-12-30T05:00:00+05:00', '2023-12-30T19:00:00-05:00'),
+        ]
+        exported, listed = [], []
+        for start, end in forms:
+            params = {'start': start, 'end': end}
+            response = requests.get(f"{BASE_URL}/export/orders", params=params)
+            exported.append(len(response.text.splitlines()) if response.status_code == 200 else response.status_code)
+            response = requests.get(f"{BASE_URL}/orders", params=dict(params, per_page=1))
+            listed.append(response.json()['pagination']['total_count'] if response.status_code == 200
+                          else response.status_code)
+        print(f"Exported rows per form: {exported}, listed: {listed}")
+        if len(set(exported)) == 1 and len(set(listed)) == 1 and exported == listed:
+            print("✅ Date forms normalized!")
+        else:
+            print("❌ Date forms selected different rows")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
+    
+    print("\n" + "-" * 30)
+    
+    # Test 17: Dates before year 1000 still compare as dates
+    print("17. Testing start=0999-01-01 on /api/orders and /api/export/orders")
+    try:
+        everything = requests.get(f"{BASE_URL}/orders", params={'per_page': 1}).json()['pagination']['total_count']
+        response = requests.get(f"{BASE_URL}/orders", params={'start': '0999-01-01', 'per_page': 1})
+        print(f"Status Code: {response.status_code}")
+        listed = response.json()['pagination']['total_count'] if response.status_code == 200 else None
+        plain = requests.get(f"{BASE_URL}/export/orders", params={'end': '2019-01-02'})
+        early = requests.get(f"{BASE_URL}/export/orders", params={'start': '0999-01-01', 'end': '2019-01-02'})
+        exported = (len(plain.text.splitlines()), len(early.text.splitlines()))
+        print(f"Orders: {everything}, from 0999-01-01: {listed}; exported before 2019-01-02: {exported}")
+        if listed == everything and exported[0] == exported[1] and early.status_code == 200:
+            print("✅ Early dates working!")
+        else:
+            print("❌ Early start dates dropped rows")
+    except Exception as e:
+        print(f"❌ Connection error: {e}")
 
 if __name__ == "__main__":
     test_api() 
\ No newline at end of file
@@ -121,6 +121,162 @@ def test_error_handling():
     except Exception as e:
         print(f"❌ Error: {e}")
     
+    # Test 9: Invalid batch ids
+    print("\n9. Testing Invalid Batch Ids")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/customers?ids=1,abc")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Invalid batch ids return 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 10: Invalid time series granularity
+    print("\n10. Testing Invalid Time Series Granularity")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/analytics/orders/timeseries?granularity=year")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Invalid granularity returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 11: Invalid fulfillment grouping
+    print("\n11. Testing Invalid Fulfillment group_by")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/analytics/fulfillment?group_by=country")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Invalid group_by returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 12: Segment bound that does not match the metric
+    print("\n12. Testing Invalid Customer Segment Bound")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/analytics/customers/segment?by=first_order_at&min=3")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Invalid segment bound returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 13: Sort that no index can serve with the filter
+    print("\n13. Testing Unindexed Filter/Sort Combination")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/customers?min_age=30&max_age=40&sort=created_at")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Unindexed sort returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 14: Integer filter too large for SQLite
+    print("\n14. Testing Out-of-Range Integer Filter")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/orders?user_id=99999999999999999999")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Out-of-range user_id returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 15: Cursor holding an id too large for SQLite
+    print("\n15. Testing Out-of-Range Cursor")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/customers?cursor=WzEwMDAwMDAwMDAwMDAwMDAwMDAwMF0")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Out-of-range cursor returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 16: Export filter too large for SQLite
+    print("\n16. Testing Out-of-Range Export Filter")
+    print("-" * 30)
+    try:
+        response = requests.get(f"{BASE_URL}/export/orders?user_id=99999999999999999999")
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        if response.status_code == 400:
+            print("✅ PASS: Out-of-range export user_id returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400, got {response.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 17: Page number whose offset is too large for SQLite
+    print("\n17. Testing Out-of-Range Page Number")
+    print("-" * 30)
+    try:
+        statuses = [requests.get(f"{BASE_URL}/{path}page=99999999999999999999").status_code
+                    for path in ('customers?', 'orders?', 'customers/search?q=john&')]
+        print(f"Status Codes: {statuses}")
+        if statuses == [400, 400, 400]:
+            print("✅ PASS: Out-of-range page returns 400")
+        else:
+            print(f"❌ FAIL: Expected 400s, got {statuses}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 18: Segment bounds and page at the edges of SQLite's range
+    print("\n18. Testing Out-of-Range Customer Segment Parameters")
+    print("-" * 30)
+    try:
+        statuses = [requests.get(f"{BASE_URL}/analytics/customers/segment?{query}").status_code
+                    for query in ('min=99999999999999999999', 'page=99999999999999999999')]
+        last_day = requests.get(f"{BASE_URL}/analytics/customers/segment?by=first_order_at&max=9999-12-31")
+        print(f"Status Codes: {statuses}, max=9999-12-31: {last_day.status_code}")
+        if statuses == [400, 400] and last_day.status_code == 200:
+            print("✅ PASS: Out-of-range segment parameters return 400")
+        else:
+            print(f"❌ FAIL: Expected [400, 400] and 200, got {statuses} and {last_day.status_code}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
+    # Test 19: Time series reaching the last representable date
+    print("\n19. Testing Time Series at the End of the Calendar")
+    print("-" * 30)
+    try:
+        statuses = [requests.get(f"{BASE_URL}/analytics/orders/timeseries?{query}").status_code
+                    for query in ('granularity=month&start=9990-01-01&end=9999-12-31',
+                                  'granularity=week&start=9999-01-01&end=9999-12-31')]
+        print(f"Status Codes: {statuses}")
+        if statuses == [200, 200]:
+            print("✅ PASS: Series ending at 9999-12-31 are answered")
+        else:
+            print(f"❌ FAIL: Expected 200s, got {statuses}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+    
     # Summary
     print("\n" + "=" * 60)
     print("📋 ERROR HANDLING SUMMARY")
@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+
+
+def parse_timestamp(value):
+    """Turn an ISO date or datetime into UTC text that compares correctly with the stored timestamps
+
+    Timestamps are stored as 'YYYY-MM-DD HH:MM:SS+00:00' and compared as
+    text, so the value is normalized rather than bound as given: offsets are
+    converted to UTC, and '2022-01-31T00:00', '20220131' and '2022-01-31'
+    all become '2022-01-31'. Raises ValueError for anything else.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    except OverflowError:
+        # An offset that moves the value past year 1 or 9999
+        raise ValueError(f'{value!r} is out of range')
+    # isoformat() always writes four-digit years; strftime('%Y') does not below 1000
+    if parsed.time() == datetime.min.time():
+        return parsed.date().isoformat()
+    return parsed.isoformat(' ', timespec='seconds')
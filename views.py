@@ -0,0 +1,224 @@
+from datetime import datetime
+
+import queries
+from cache import InvalidBatch, cached_lookup, batch_lookup, parse_ids_arg
+from pagination import encode_cursor, decode_cursor, fetch_orders_after, page_error, InvalidCursor
+from query_builder import ORDERS, CUSTOMERS, InvalidListQuery, wants_list_query, list_page
+from serializers import Rows
+
+# The customer, order and statistics endpoints, written once for both servers:
+# app.py wraps them in Flask routes and asgi.py runs them on its database
+# threads. A view takes a connection and the query arguments (plus any ids
+# from the path) and returns (payload, status); bad input raises one of
+# CLIENT_ERRORS, which both servers answer with a 400 and its message.
+
+CLIENT_ERRORS = (InvalidCursor, InvalidListQuery, InvalidBatch)
+
+
+def bool_arg(args, name, default):
+    """Read a true/false query parameter such as include_total=false"""
+    value = args.get(name)
+    if value is None:
+        return default
+    return value.lower() not in ('0', 'false', 'no', 'off')
+
+
+def page_args(args):
+    """page and per_page, or a 400 response body if they are out of range"""
+    page = args.get('page', 1, type=int)
+    per_page = args.get('per_page', 10, type=int)
+    error = page_error(page, per_page)
+    if error:
+        return None, None, {'error': error}
+    return page, per_page, None
+
+
+class Views:
+    """Endpoint logic over a server's count and entity caches"""
+
+    def __init__(self, count_cache, entity_cache):
+        self.count_cache = count_cache
+        self.entity_cache = entity_cache
+
+    def list_customers(self, conn, args):
+        """List all customers with page or cursor pagination, filtered and sorted, or look up ?ids=1,2,3"""
+        if 'ids' in args:
+            return self.customers_batch(conn, parse_ids_arg(args['ids']))
+
+        page, per_page, error = page_args(args)
+        if error:
+            return error, 400
+        cursor = args.get('cursor')
+
+        if wants_list_query(CUSTOMERS, args):
+            return self.filtered_list(conn, args, CUSTOMERS, 'customers', page, per_page)
+
+        if cursor is not None:
+            # Keyset pagination: seek past the last id instead of skipping rows
+            after_id = decode_cursor(cursor, (int,))[0] if cursor else 0
+            customers = conn.execute(queries.CUSTOMERS_AFTER, (after_id, per_page + 1)).fetchall()
+            has_next = len(customers) > per_page
+            customers_list = Rows(customers[:per_page])
+            return {
+                'customers': customers_list,
+                'pagination': {
+                    'per_page': per_page,
+                    'cursor': cursor,
+                    'next_cursor': encode_cursor(customers_list[-1]['id']) if has_next else None,
+                    'has_next': has_next
+                }
+            }, 200
+
+        # One page plus one row to tell if there is a next page
+        customers = conn.execute(queries.CUSTOMERS_PAGE, (per_page + 1, (page - 1) * per_page)).fetchall()
+        has_next = len(customers) > per_page
+        customers_list = Rows(customers[:per_page])
+
+        # Total count is cached until the users table changes, or skipped entirely
+        total_count = total_pages = None
+        if bool_arg(args, 'include_total', True):
+            total_count = self.count_cache.get(conn, 'users', queries.CUSTOMERS_COUNT)
+            total_pages = (total_count + per_page - 1) // per_page
+
+        return {
+            'customers': customers_list,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total_count': total_count,
+                'total_pages': total_pages,
+                'has_next': has_next,
+                'has_prev': page > 1,
+                'next_cursor': encode_cursor(customers_list[-1]['id']) if has_next else None
+            }
+        }, 200
+
+    def customers_batch(self, conn, ids):
+        """Details and order counts for many customers, in the order asked for"""
+        customers, not_found = batch_lookup(
+            self.entity_cache, conn, 'customer', ids, queries.CUSTOMERS_DETAILS_BY_IDS, 'id'
+        )
+        return {'customers': customers, 'not_found': not_found}, 200
+
+    def customer_details(self, conn, args, customer_id):
+        """Get specific customer details including order totals"""
+        def load():
+            customer = conn.execute(queries.CUSTOMER_DETAILS, (customer_id,)).fetchone()
+            return dict(customer) if customer else None
+
+        customer = cached_lookup(self.entity_cache, conn, ('customer', customer_id), load)
+        if customer is None:
+            return {'error': 'Customer not found'}, 404
+        return {'customer': customer}, 200
+
+    def customer_orders(self, conn, args, customer_id):
+        """Get all orders for a specific customer"""
+        def load():
+            if not conn.execute(queries.CUSTOMER_EXISTS, (customer_id,)).fetchone():
+                return None
+            # Rows are immutable, so they can be cached as they are
+            return Rows(conn.execute(queries.CUSTOMER_ORDERS, (customer_id,)).fetchall())
+
+        orders = cached_lookup(self.entity_cache, conn, ('customer_orders', customer_id), load)
+        if orders is None:
+            return {'error': 'Customer not found'}, 404
+        return {'customer_id': customer_id, 'orders': orders, 'total_orders': len(orders)}, 200
+
+    def list_orders(self, conn, args):
+        """Get all orders with page or cursor pagination, filtered and sorted, or look up ?ids=1,2,3"""
+        if 'ids' in args:
+            return self.orders_batch(conn, parse_ids_arg(args['ids']))
+
+        page, per_page, error = page_args(args)
+        if error:
+            return error, 400
+        cursor = args.get('cursor')
+
+        if wants_list_query(ORDERS, args):
+            return self.filtered_list(conn, args, ORDERS, 'orders', page, per_page)
+
+        if cursor is not None:
+            # Keyset pagination on (created_at, order_id), newest first
+            after = decode_cursor(cursor, ((str, type(None)), int)) if cursor else None
+            orders = fetch_orders_after(conn, after, per_page + 1)
+            has_next = len(orders) > per_page
+            orders_list = Rows(orders[:per_page])
+            last = orders_list[-1] if orders_list else None
+            return {
+                'orders': orders_list,
+                'pagination': {
+                    'per_page': per_page,
+                    'cursor': cursor,
+                    'next_cursor': encode_cursor(last['created_at'], last['order_id']) if has_next else None,
+                    'has_next': has_next
+                }
+            }, 200
+
+        # Orders with customer information, plus one row to tell if there is a next page
+        orders = conn.execute(queries.ORDERS_PAGE, (per_page + 1, (page - 1) * per_page)).fetchall()
+        has_next = len(orders) > per_page
+        orders_list = Rows(orders[:per_page])
+
+        # Total count is cached until the orders table changes, or skipped entirely
+        total_count = total_pages = None
+        if bool_arg(args, 'include_total', True):
+            total_count = self.count_cache.get(conn, 'orders', queries.ORDERS_COUNT)
+            total_pages = (total_count + per_page - 1) // per_page
+        last = orders_list[-1] if orders_list else None
+
+        return {
+            'orders': orders_list,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total_count': total_count,
+                'total_pages': total_pages,
+                'has_next': has_next,
+                'has_prev': page > 1,
+                'next_cursor': encode_cursor(last['created_at'], last['order_id']) if has_next else None
+            }
+        }, 200
+
+    def orders_batch(self, conn, ids):
+        """Details for many orders, in the order asked for"""
+        orders, not_found = batch_lookup(
+            self.entity_cache, conn, 'order', ids, queries.ORDERS_DETAILS_BY_IDS, 'order_id'
+        )
+        return {'orders': orders, 'not_found': not_found}, 200
+
+    def order_details(self, conn, args, order_id):
+        """Get specific order details"""
+        def load():
+            order = conn.execute(queries.ORDER_DETAILS, (order_id,)).fetchone()
+            return dict(order) if order else None
+
+        order = cached_lookup(self.entity_cache, conn, ('order', order_id), load)
+        if order is None:
+            return {'error': 'Order not found'}, 404
+        return {'order': order}, 200
+
+    def statistics(self, conn, args):
+        """Get basic order statistics from the materialized store, or exactly with ?fresh=1"""
+        stats = None
+        if not bool_arg(args, 'fresh', False):
+            # Kept current by triggers on orders, so this is a single row read
+            stats = conn.execute(queries.MATERIALIZED_STATISTICS).fetchone()
+
+        if stats is not None:
+            stats = dict(stats)
+            updated_at = stats.pop('updated_at')
+            source = 'materialized'
+        else:
+            # Recompute over the whole orders table
+            stats = dict(conn.execute(queries.STATISTICS).fetchone())
+            updated_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            source = 'exact'
+
+        return {'statistics': stats, 'updated_at': updated_at, 'source': source}, 200
+
+    @staticmethod
+    def filtered_list(conn, args, spec, name, page, per_page):
+        """One page of a list endpoint's rows filtered and sorted by the query string"""
+        if args.get('cursor') is not None:
+            raise InvalidListQuery('Cursor pagination only lists in the default order; use page with filters or sort')
+        return list_page(conn, spec, name, args, page, per_page, bool_arg(args, 'include_total', True)), 200